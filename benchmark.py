@@ -0,0 +1,187 @@
+"""Замеры скорости разбора страниц на сохранённых HTML, без обращения к сайту
+
+Один раз сохранить страницы:
+    python benchmark.py --record 50
+Потом замерять сколько угодно раз:
+    python benchmark.py [--backends bs4 lxml] [--repeat 3]
+
+Для каждого backend'а из page_parser выводится время каждой функции
+извлечения на одну страницу и на 1000 страниц, пиковая память при разборе
+всех страниц и число страниц, на которых backend'ы дали разный результат.
+
+    python benchmark.py --names
+сравнивает скорость sanitize_filename и прежней посимвольной реализации на
+всех буквах кириллицы, случайных строках и названиях товаров из сохранённых
+страниц. Совпадение результатов проверяет tests/test_filenames.py.
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import time
+import tracemalloc
+
+import html_sanitizer
+import metrics
+import mock_site
+import page_parser
+import parser2
+import parser_photo_final
+
+FIXTURES_DIR = mock_site.FIXTURES_DIR
+CATALOG_FIXTURE = mock_site.CATALOG_FIXTURE
+
+def load_fixtures(fixtures_dir):
+    with open(os.path.join(fixtures_dir, CATALOG_FIXTURE), encoding='utf-8') as f:
+        catalog = f.read()
+    pages = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "product_*.html"))):
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    return catalog, pages
+
+def _timed(func, items):
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return time.perf_counter() - started
+
+def _old_description(page):
+    description = parser2.extract_description(page.block('desc'))
+    return description, parser2.extract_first_paragraph(description)
+
+def measure(backend, catalog, pages, repeat):
+    """Возвращает {этап: лучшее время на одну страницу в секундах}"""
+    stages = {
+        'название': lambda page: page.title(),
+        'характеристики': lambda page: page.characteristics(),
+        'изображение': lambda page: page.image_attributes(),
+        'описание': lambda page: html_sanitizer.sanitize_description(page.block('desc')),
+        'описание (старая цепочка)': _old_description,
+    }
+    best = {}
+
+    def keep_best(stage, seconds):
+        best[stage] = min(best.get(stage, seconds), seconds)
+
+    for _ in range(repeat):
+        # Страница каталога одна, её время - на весь каталог, а не на товар
+        keep_best('ссылки каталога', _timed(
+            lambda html: page_parser.parse_page(html, backend).product_links(), [catalog]))
+        keep_best('разбор страницы', _timed(lambda html: page_parser.parse_page(html, backend), pages) / len(pages))
+        # Блок описания очищается на месте, поэтому каждый этап получает свежий разбор
+        for stage, func in stages.items():
+            documents = [page_parser.parse_page(html, backend) for html in pages]
+            keep_best(stage, _timed(func, documents) / len(pages))
+        keep_best('товар целиком', _timed(
+            lambda html: parser2.parse_product_document(page_parser.parse_page(html, backend)),
+            pages) / len(pages))
+    return best
+
+def peak_memory(backend, pages):
+    """Пиковая память в байтах при разборе всех страниц подряд"""
+    tracemalloc.start()
+    for html in pages:
+        parser2.parse_product_document(page_parser.parse_page(html, backend))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def count_mismatches(backends, pages):
+    """Число страниц, на которых backend'ы вернули разные данные товара"""
+    mismatches = 0
+    for html in pages:
+        results = [parser2.parse_product_document(page_parser.parse_page(html, backend))
+                   for backend in backends]
+        if any(result != results[0] for result in results[1:]):
+            mismatches += 1
+    return mismatches
+
+def _old_sanitize_filename(filename):
+    """Прежняя реализация sanitize_filename - эталон для сравнения"""
+    translit_dict = {
+        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+        'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+        'А': 'a', 'Б': 'b', 'В': 'v', 'Г': 'g', 'Д': 'd', 'Е': 'e', 'Ё': 'e',
+        'Ж': 'zh', 'З': 'z', 'И': 'i', 'Й': 'y', 'К': 'k', 'Л': 'l', 'М': 'm',
+        'Н': 'n', 'О': 'o', 'П': 'p', 'Р': 'r', 'С': 's', 'Т': 't', 'У': 'u',
+        'Ф': 'f', 'Х': 'h', 'Ц': 'ts', 'Ч': 'ch', 'Ш': 'sh', 'Щ': 'sch',
+        'Ъ': '', 'Ы': 'y', 'Ь': '', 'Э': 'e', 'Ю': 'yu', 'Я': 'ya'
+    }
+    latin_name = ''.join(translit_dict.get(char, char) for char in filename)
+    latin_name = re.sub(r'[\\/*?:"<>|]', "", latin_name)
+    latin_name = re.sub(r'[\s,]+', "_", latin_name)
+    latin_name = re.sub(r'_+', "_", latin_name)
+    return latin_name.lower().strip('_')
+
+def sample_names(titles, count=20000, seed=1):
+    """Названия для проверки: все буквы кириллицы по одной и вместе, случайные строки и titles"""
+    cyrillic = [chr(code) for code in range(0x400, 0x530)]
+    alphabet = cyrillic + list('abcXYZ019-._,;:!?*/\\|<>"\'«»() \t\n\u00a0\u2009')
+    rng = random.Random(seed)
+    names = cyrillic + [''.join(cyrillic), ' '.join(cyrillic)] + list(titles)
+    names += [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(count)]
+    return names
+
+def measure_names(names, repeat):
+    """Лучшее время на 1000 названий у прежней и новой реализации"""
+    implementations = {
+        'прежняя': _old_sanitize_filename,
+        'translate': parser_photo_final.sanitize_filename.__wrapped__,
+        'translate + кэш': parser_photo_final.sanitize_filename,
+    }
+    best = {}
+    for _ in range(repeat):
+        for name, func in implementations.items():
+            seconds = _timed(func, names) / len(names) * 1000
+            best[name] = min(best.get(name, seconds), seconds)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора страниц на сохранённых HTML")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help="папка с сохранёнными страницами")
+    parser.add_argument('--backends', nargs='+', choices=page_parser.BACKENDS, default=list(page_parser.BACKENDS))
+    parser.add_argument('--repeat', type=int, default=3, help="сколько раз повторить замер (берётся лучший)")
+    parser.add_argument('--record', type=int, metavar='N', help="сохранить каталог и N страниц товаров с сайта")
+    parser.add_argument('--names', action='store_true', help="замерить только sanitize_filename")
+    args = parser.parse_args()
+
+    if args.names:
+        pages = load_fixtures(args.fixtures)[1] if os.path.exists(args.fixtures) else []
+        names = sample_names(page_parser.parse_page(html).title() or '' for html in pages)
+        best = measure_names(names, args.repeat)
+        print(f"Названий: {len(names)}")
+        print(f"{'реализация':<20}{'мс/1000 названий':>18}")
+        for name, seconds in best.items():
+            print(f"{name:<20}{seconds * 1000:>18.2f}")
+        return
+
+    if args.record:
+        metrics.configure_logging()
+        mock_site.record(args.record, args.fixtures)
+        return
+
+    catalog, pages = load_fixtures(args.fixtures)
+    if not pages:
+        print(f"В {args.fixtures} нет страниц товаров, сначала запустите с --record N")
+        return
+    print(f"Страниц товаров: {len(pages)}\n")
+
+    for backend in args.backends:
+        best = measure(backend, catalog, pages, args.repeat)
+        print(f"[{backend}]")
+        # мс на страницу численно равны секундам на 1000 страниц
+        print(f"{'этап':<28}{'мс/страница':>14}{'страниц/с':>14}")
+        for stage, seconds in best.items():
+            print(f"{stage:<28}{seconds * 1000:>14.2f}{1 / seconds if seconds else 0:>14.0f}")
+        print(f"пиковая память: {peak_memory(backend, pages) / 1024 / 1024:.1f} МБ\n")
+
+    if len(args.backends) > 1:
+        print(f"Страниц с разным результатом у backend'ов: {count_mismatches(args.backends, pages)}")
+
+if __name__ == "__main__":
+    main()
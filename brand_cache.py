@@ -0,0 +1,116 @@
+"""Кэш информации о производителях
+
+Блок li#brand одинаков у всех товаров одного производителя, поэтому он
+очищается (html_sanitizer) один раз за запуск для каждого производителя -
+при обычном разборе страницы товара, без отдельного запроса. В данных
+товара ('manufacturer') хранится только ключ производителя: значение
+характеристики «Производитель» (или «Бренд»), а если её нет - хэш блока.
+Сам HTML берётся через get(ключ).
+
+Кэш сохраняется в BRAND_CACHE_FILE и при следующем запуске позволяет
+получить информацию о производителе, даже если страница её не содержит.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import html_sanitizer
+
+BRAND_CACHE_FILE = "brands.json"
+# Характеристики, в которых сайт указывает производителя
+BRAND_CHARACTERISTICS = ('Производитель', 'Бренд')
+
+logger = logging.getLogger(__name__)
+
+class BrandCache:
+    """Информация о производителях: ключ -> очищенный HTML"""
+
+    def __init__(self, filename=BRAND_CACHE_FILE):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.brands = {}
+        # Производители, чей блок уже очищен в этом запуске
+        self.refreshed = set()
+        self.changed = False
+        # Изменения после прошлого take_updates (для передачи из процессов разбора)
+        self.updates = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, encoding='utf-8') as f:
+                    self.brands = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать {filename}: {e}")
+
+    def resolve(self, page, characteristics):
+        """Возвращает ключ производителя товара, при первой встрече запоминая его информацию"""
+        block = None
+        key = next((characteristics[name] for name in BRAND_CHARACTERISTICS if characteristics.get(name)), None)
+        if key is None:
+            block = page.block('brand')
+            if not block:
+                return None
+            key = '#' + hashlib.sha1(str(block).encode('utf-8')).hexdigest()[:16]
+        with self.lock:
+            if key in self.refreshed:
+                return key
+        if block is None:
+            block = page.block('brand')
+        if not block:
+            # Производитель ещё не обновлён: блок может быть на странице другого его товара
+            return key
+        info = html_sanitizer.sanitize_description(block)[0]
+        with self.lock:
+            self.refreshed.add(key)
+            if self.brands.get(key) != info:
+                self.brands[key] = info
+                self.updates[key] = info
+                self.changed = True
+        return key
+
+    def take_updates(self):
+        """Возвращает и забывает информацию, изменённую после прошлого вызова"""
+        with self.lock:
+            updates, self.updates = self.updates, {}
+            return updates
+
+    def update(self, brands):
+        """Добавляет информацию, собранную в другом процессе"""
+        with self.lock:
+            for key, info in brands.items():
+                if self.brands.get(key) != info:
+                    self.brands[key] = info
+                    self.changed = True
+
+    def get(self, key, default="Нет информации"):
+        with self.lock:
+            return self.brands.get(key, default) if key else default
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            temp_filename = f"{self.filename}.tmp"
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                json.dump(self.brands, f, ensure_ascii=False, indent=2)
+            os.replace(temp_filename, self.filename)
+            self.changed = False
+        logger.info(f"Информация о производителях ({len(self.brands)}) сохранена в {self.filename}")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Общий для всех потоков кэш, загружаемый при первом обращении"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BrandCache()
+        return _cache
+
+def save():
+    with _cache_lock:
+        cache = _cache
+    if cache is not None:
+        cache.save()
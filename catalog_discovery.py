@@ -0,0 +1,131 @@
+"""Поиск ссылок на товары по нескольким разделам каталога и sitemap.xml
+
+Раздел обходится постранично (параметр PAGE_PARAM, как в пагинации Bitrix),
+вместо одной огромной страницы с SHOWALL_1=1. Ссылки отдаются по мере
+загрузки страниц, а discover_in_background загружает их в отдельном потоке,
+так что разбор первых товаров начинается до того, как найдены последние.
+Товар, встретившийся в нескольких разделах, отдаётся один раз - с первым
+разделом, в котором он найден.
+
+Необязательный profile (site_profile.SiteProfile) задаёт заголовки запросов
+и селекторы страниц каталога; без него используются настройки visterma.ru.
+
+В необязательный список incomplete добавляются разделы и sitemap.xml, обход
+которых оборвался из-за ошибки: товары из их непройденной части не найдены,
+и change_tracker не снимает пропавшие товары с публикации.
+"""
+import logging
+import queue
+import re
+import threading
+import xml.etree.ElementTree as ET
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import http_client
+import metrics
+import page_parser
+
+PAGE_PARAM = "PAGEN_1"
+# Предохранитель от бесконечного обхода, если сайт не перестаёт отдавать страницы
+MAX_PAGES = 500
+# Какие адреса из sitemap.xml считать страницами товаров: /catalog/<раздел>/<товар>/
+SITEMAP_PRODUCT_PATTERN = re.compile(r'/catalog/[^/]+/[^/]+/$')
+# Сколько найденных ссылок может ждать обработки, пока поток поиска не остановится
+PREFETCH = 1000
+
+logger = logging.getLogger(__name__)
+
+def page_url(category_url, number):
+    """Адрес страницы number раздела; первая страница - сам раздел"""
+    if number == 1:
+        return category_url
+    parts = urlsplit(category_url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != PAGE_PARAM]
+    query.append((PAGE_PARAM, str(number)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def iter_category(category_url, profile=None, incomplete=None):
+    """Отдаёт пары (ссылка на товар, название раздела) страница за страницей
+
+    Обход заканчивается на странице без новых товаров: Bitrix на номер
+    больше последнего отдаёт последнюю страницу ещё раз.
+    """
+    seen = set()
+    category = ''
+    for number in range(1, MAX_PAGES + 1):
+        url = page_url(category_url, number)
+        try:
+            with metrics.stage('catalog'):
+                response = http_client.fetch(url, headers=profile.headers if profile else None)
+                page = page_parser.parse_page(response.text, selectors=profile.selectors if profile else None)
+        except Exception as e:
+            logger.error(f"Ошибка при получении страницы каталога {url}: {e}")
+            if incomplete is not None:
+                incomplete.append(category_url)
+            return
+        if number == 1:
+            category = page.title() or ''
+        links = [urljoin(url, href) for href in page.product_links()]
+        new_links = [link for link in links if link not in seen]
+        if not new_links:
+            return
+        logger.info(f"Раздел «{category}», страница {number}: найдено {len(new_links)} товаров")
+        for link in new_links:
+            seen.add(link)
+            yield link, category
+
+def iter_sitemap(sitemap_url, profile=None, incomplete=None):
+    """Отдаёт ссылки на товары из sitemap.xml, заходя во вложенные sitemap"""
+    try:
+        with metrics.stage('catalog'):
+            response = http_client.fetch(sitemap_url, headers=profile.headers if profile else None)
+            root = ET.fromstring(response.content)
+    except Exception as e:
+        logger.error(f"Ошибка при получении {sitemap_url}: {e}")
+        if incomplete is not None:
+            incomplete.append(sitemap_url)
+        return
+    nested = root.tag.endswith('sitemapindex')
+    for loc in root.iter():
+        if not loc.tag.endswith('loc') or not loc.text:
+            continue
+        url = loc.text.strip()
+        if nested:
+            yield from iter_sitemap(url, profile, incomplete)
+        elif SITEMAP_PRODUCT_PATTERN.search(urlsplit(url).path):
+            yield url, ''
+
+def discover_products(catalog_urls, sitemap_url=None, profile=None, incomplete=None):
+    """Отдаёт пары (ссылка на товар, раздел) без повторов по всем источникам"""
+    sources = [iter_category(url, profile, incomplete) for url in catalog_urls]
+    if sitemap_url:
+        sources.append(iter_sitemap(sitemap_url, profile, incomplete))
+    seen = set()
+    duplicates = 0
+    for source in sources:
+        for url, category in source:
+            if url in seen:
+                duplicates += 1
+                continue
+            seen.add(url)
+            yield url, category
+    logger.info(f"Поиск товаров завершён: найдено {len(seen)}, повторов в разных разделах {duplicates}")
+
+def discover_in_background(catalog_urls, sitemap_url=None, profile=None, incomplete=None):
+    """То же, что discover_products, но страницы каталога загружаются в отдельном потоке"""
+    found = queue.Queue(maxsize=PREFETCH)
+    done = object()
+
+    def worker():
+        try:
+            for item in discover_products(catalog_urls, sitemap_url, profile, incomplete):
+                found.put(item)
+        finally:
+            found.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        item = found.get()
+        if item is done:
+            return
+        yield item
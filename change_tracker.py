@@ -0,0 +1,184 @@
+"""Отбор новых, изменённых и удалённых товаров для импорта только изменений
+
+После каждого полного запуска для каждой строки итогового CSV считается
+отпечаток - SHA-256 всех её колонок (название, описания, атрибуты,
+изображение, раздел). Отпечатки хранятся в файле рядом с CSV, ключ - артикул,
+а для товаров без артикула - название. В следующий раз в CSV изменений
+попадают только товары, которых не было, и товары с другим отпечатком.
+Товары, пропавшие с сайта, добавляются в конец с Опубликован = 0 и скрытой
+видимостью, чтобы импорт снял их с публикации.
+
+Пропавшим считается только товар, которого не нашёл поиск по каталогу.
+Обход сохраняет рядом с CSV сведения о запуске (save_run): URL товара
+каждой строки, URL страниц, которые не удалось обработать, и разделы
+каталога, загруженные не полностью. Товар, чья страница не загрузилась,
+сохраняет прежний отпечаток; если раздел загружен не полностью, пропавшие
+товары не снимаются с публикации вовсе. То же происходит, если пропала
+больше чем MAX_REMOVED_SHARE часть товаров: скорее всего, не загрузился
+раздел каталога. Такие товары остаются в хранилище отпечатков до
+следующего запуска.
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+
+FINGERPRINTS_SUFFIX = ".fingerprints.json"
+RUN_SUFFIX = ".run.json"
+DELTA_SUFFIX = "_delta"
+MAX_REMOVED_SHARE = 0.5
+
+logger = logging.getLogger(__name__)
+
+def delta_filename(csv_file):
+    """visterma_products.csv -> visterma_products_delta.csv"""
+    base, ext = os.path.splitext(csv_file)
+    return f"{base}{DELTA_SUFFIX}{ext}"
+
+def fingerprint(row, fieldnames):
+    """SHA-256 значений строки CSV в порядке колонок"""
+    digest = hashlib.sha256()
+    for name in fieldnames:
+        digest.update(row.get(name, '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def row_key(row, seen):
+    """Ключ товара: артикул, а без артикула - название
+
+    Повторяющиеся ключи нумеруются по порядку строк, чтобы товары
+    с одинаковым артикулом не затирали отпечатки друг друга.
+    """
+    key = row['Артикул'] or f"name:{row['Имя']}"
+    seen[key] = seen.get(key, 0) + 1
+    if seen[key] > 1:
+        key = f"{key}#{seen[key]}"
+    return key
+
+def load_fingerprints(filename):
+    if not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать {filename}: {e}")
+        return {}
+
+def save_fingerprints(filename, fingerprints):
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump(fingerprints, f, ensure_ascii=False)
+    os.replace(temp_filename, filename)
+
+def save_run(csv_file, urls, failed_urls, incomplete):
+    """Сохраняет сведения о завершённом обходе для export_delta
+
+    urls - URL товара для каждой строки CSV по порядку, failed_urls - страницы,
+    которые не удалось обработать, incomplete - разделы каталога и sitemap,
+    загруженные не полностью (см. catalog_discovery).
+    """
+    filename = csv_file + RUN_SUFFIX
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump({'urls': list(urls), 'failed_urls': sorted(failed_urls), 'incomplete': list(incomplete)},
+                  f, ensure_ascii=False)
+    os.replace(temp_filename, filename)
+
+def load_run(csv_file):
+    """Сведения о последнем обходе или пустой словарь, если их нет"""
+    return load_fingerprints(csv_file + RUN_SUFFIX)
+
+def removed_row(fieldnames, key, info):
+    """Строка, снимающая пропавший товар с публикации"""
+    row = dict.fromkeys(fieldnames, '')
+    row.update({
+        'ID': info.get('id', ''),
+        'Тип': 'simple',
+        'Артикул': info.get('article', ''),
+        'Имя': info.get('name', ''),
+        'Опубликован': 0,
+        'Видимость в каталоге': 'hidden',
+    })
+    return row
+
+def export_delta(csv_file):
+    """Пишет CSV только с изменившимися товарами и обновляет хранилище отпечатков
+
+    Возвращает словарь с числом новых, изменённых, удалённых и прежних товаров
+    или None, если CSV прочитать не удалось.
+    """
+    fingerprints_file = csv_file + FINGERPRINTS_SUFFIX
+    output_file = delta_filename(csv_file)
+    previous = load_fingerprints(fingerprints_file)
+    run = load_run(csv_file)
+    urls = run.get('urls', [])
+    failed_urls = set(run.get('failed_urls', []))
+    incomplete = run.get('incomplete', [])
+    current = {}
+    seen = {}
+    summary = {'new': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+
+    try:
+        with open(csv_file, newline='', encoding='utf-8-sig') as source, \
+                open(f"{output_file}.tmp", 'w', newline='', encoding='utf-8-sig') as delta:
+            reader = csv.DictReader(source)
+            fieldnames = reader.fieldnames
+            writer = csv.DictWriter(delta, fieldnames=fieldnames)
+            writer.writeheader()
+            for index, row in enumerate(reader):
+                key = row_key(row, seen)
+                digest = fingerprint(row, fieldnames)
+                current[key] = {'sha256': digest, 'id': row['ID'], 'article': row['Артикул'], 'name': row['Имя']}
+                if index < len(urls):
+                    current[key]['url'] = urls[index]
+                old = previous.get(key)
+                if old is None:
+                    summary['new'] += 1
+                elif old['sha256'] != digest:
+                    summary['changed'] += 1
+                else:
+                    summary['unchanged'] += 1
+                    continue
+                writer.writerow(row)
+
+            # Число строк не совпало - CSV записан не тем обходом, сведения о нём не подходят
+            if urls and len(urls) != sum(seen.values()):
+                logger.warning(f"Сведения о запуске не соответствуют {csv_file} и не учитываются")
+                failed_urls, incomplete = set(), []
+                for info in current.values():
+                    info.pop('url', None)
+
+            missing = [key for key in previous if key not in current]
+            # Страница товара не загрузилась в этот раз - это не повод снимать его с публикации
+            failed = [key for key in missing if previous[key].get('url') in failed_urls]
+            for key in failed:
+                current[key] = previous[key]
+            if failed:
+                logger.info(f"Не удалось обработать {len(failed)} товаров, их прежние отпечатки сохранены")
+            removed = [key for key in missing if key not in current]
+            if removed and incomplete:
+                logger.warning(f"Не полностью загружены: {', '.join(incomplete)}. Пропавшие товары "
+                               f"({len(removed)}) не будут сняты с публикации")
+                for key in removed:
+                    current[key] = previous[key]
+            elif removed and len(removed) > len(previous) * MAX_REMOVED_SHARE:
+                logger.warning(f"Пропало {len(removed)} из {len(previous)} товаров - похоже, каталог загрузился "
+                               f"не полностью. Они не будут сняты с публикации")
+                for key in removed:
+                    current[key] = previous[key]
+            else:
+                for key in removed:
+                    writer.writerow(removed_row(fieldnames, key, previous[key]))
+                summary['removed'] = len(removed)
+        os.replace(f"{output_file}.tmp", output_file)
+    except Exception as e:
+        logger.error(f"Ошибка при подготовке CSV изменений: {e}")
+        return None
+
+    save_fingerprints(fingerprints_file, current)
+    logger.info(f"CSV изменений сохранён в {output_file}: новых {summary['new']}, "
+                f"изменённых {summary['changed']}, удалённых {summary['removed']}, "
+                f"без изменений {summary['unchanged']}")
+    return summary
@@ -0,0 +1,92 @@
+"""Выгрузка CSV товаров и характеристик в Parquet для аналитики
+
+Для каждого CSV (visterma_products.csv и visterma_products_characteristics.csv,
+см. parser2.CsvCheckpointWriter) рядом создаётся файл .parquet. CSV читается
+кусками по CHUNK_ROWS строк, поэтому память не зависит от размера каталога.
+Все колонки сохраняются строками, кроме INTEGER_COLUMNS (целые, дробные
+значения округляются) и FLOAT_COLUMNS. Нечисловые значения в них пустые.
+
+Нужен pyarrow (pip install pyarrow), в requirements.txt он не входит.
+Запускается флагом --parquet у parser2.py и parser_full.py или отдельно
+(например, после parser_photo_final.py):
+    python columnar_export.py [visterma_products.csv]
+"""
+import logging
+import os
+import sys
+
+import pandas as pd
+
+import metrics
+
+CHUNK_ROWS = 10000
+INTEGER_COLUMNS = ['ID', 'Опубликован', 'Наличие']
+# Цена может быть дробной, если её дописали в CSV перед импортом
+FLOAT_COLUMNS = ['Базовая цена']
+
+logger = logging.getLogger(__name__)
+
+def parquet_filename(csv_file):
+    """visterma_products.csv -> visterma_products.parquet"""
+    return f"{os.path.splitext(csv_file)[0]}.parquet"
+
+def _to_number(values):
+    """Строки CSV -> числа; десятичный разделитель - точка или запятая"""
+    return pd.to_numeric(values.str.replace(',', '.', regex=False), errors='coerce')
+
+def csv_to_parquet(csv_file):
+    """Переводит один CSV в Parquet и возвращает число строк"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filename = parquet_filename(csv_file)
+    temp_filename = f"{filename}.tmp"
+    rows = 0
+    writer = None
+    try:
+        for chunk in pd.read_csv(csv_file, dtype=str, keep_default_na=False, encoding='utf-8-sig',
+                                 chunksize=CHUNK_ROWS):
+            # Типы колонок не зависят от значений, иначе схема кусков разошлась бы
+            for column in INTEGER_COLUMNS:
+                if column in chunk:
+                    chunk[column] = _to_number(chunk[column]).round().astype('Int64')
+            for column in FLOAT_COLUMNS:
+                if column in chunk:
+                    chunk[column] = _to_number(chunk[column]).astype('Float64')
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(temp_filename, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        logger.warning(f"{csv_file} пуст, Parquet не создан")
+        return 0
+    os.replace(temp_filename, filename)
+    logger.info(f"Сохранено в {filename}: {rows} строк")
+    return rows
+
+def export(csv_files):
+    """Выгружает CSV файлы в Parquet"""
+    try:
+        import pyarrow
+    except ImportError:
+        logger.error("Для выгрузки в Parquet нужен pyarrow (pip install pyarrow)")
+        return
+    with metrics.stage('parquet_export'):
+        for filename in csv_files:
+            if not os.path.exists(filename):
+                logger.warning(f"Нет файла {filename}")
+                continue
+            try:
+                csv_to_parquet(filename)
+            except Exception as e:
+                logger.error(f"Ошибка выгрузки {filename} в Parquet: {e}")
+
+if __name__ == "__main__":
+    import parser2
+    metrics.configure_logging()
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else parser2.CSV_FILE
+    export([csv_file, parser2.characteristics_filename(csv_file)])
@@ -0,0 +1,163 @@
+"""Ограничение нагрузки на сайт: число одновременных запросов и их частота
+
+Для каждого хоста заводится HostLimiter, через который http_client
+пропускает каждый запрос:
+- число одновременных запросов подстраивается по принципу AIMD: после
+  каждого спокойного ответа предел растёт примерно на единицу за «круг»
+  запросов, а после 429/503, таймаута или заметного роста времени ответа
+  уменьшается вдвое (не чаще раза в DECREASE_INTERVAL секунд);
+- частоту запросов ограничивает корзина токенов: в среднем не больше rate
+  запросов в секунду, подряд - не больше BURST;
+- если robots.txt сайта задаёт Crawl-delay или Request-rate, частота
+  дополнительно ограничивается ими;
+- Retry-After из ответа 429/503 приостанавливает все запросы к хосту.
+
+Пулы потоков в скриптах задают лишь верхнюю границу: потоки, которым
+не хватило места, ждут, пока сайт снова начнёт отвечать быстро.
+"""
+import logging
+import threading
+import time
+from urllib.robotparser import RobotFileParser
+
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+# Во сколько раз уменьшать предел при перегрузке
+DECREASE_FACTOR = 0.5
+# Не уменьшать предел чаще, чем раз в столько секунд: ответы на уже
+# отправленные запросы ещё приходят с прежней нагрузкой
+DECREASE_INTERVAL = 1.0
+# Время ответа больше базового во столько раз считается признаком перегрузки
+LATENCY_FACTOR = 2.0
+# Вес нового замера в скользящем среднем времени ответа
+EWMA_ALPHA = 0.2
+# Насколько базовое время ответа может вырасти за один ответ
+BASE_LATENCY_DRIFT = 1.001
+# Сколько запросов можно отправить подряд, накопив токены
+BURST = 5
+# Учитывать Crawl-delay и Request-rate из robots.txt
+RESPECT_ROBOTS = True
+ROBOTS_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+
+class HostLimiter:
+    """Предел одновременных запросов и корзина токенов для одного хоста"""
+
+    def __init__(self, host, rate=0, max_concurrency=MAX_CONCURRENCY):
+        self.host = host
+        self.max_concurrency = max(MIN_CONCURRENCY, min(MAX_CONCURRENCY, max_concurrency))
+        self.limit = float(min(INITIAL_CONCURRENCY, self.max_concurrency))
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.rate = rate
+        self.tokens = float(BURST)
+        self.updated = time.monotonic()
+        self.bucket_lock = threading.Lock()
+        self.paused_until = 0.0
+        self.latency = None
+        self.base_latency = None
+        self.last_decrease = 0.0
+        self.decreases = 0
+
+    def set_rate(self, rate):
+        """Ограничивает частоту запросов; 0 - без ограничения"""
+        with self.bucket_lock:
+            self.rate = rate
+
+    def acquire(self):
+        """Ждёт свободного места и токена; после запроса обязательно вызвать release"""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        delay = self._take_token()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _take_token(self):
+        """Забирает токен и возвращает, сколько ждать до его появления или конца паузы
+
+        Токенов может стать меньше нуля: так следующие потоки встают в
+        очередь за уже ждущими, а не спорят за один и тот же токен.
+        """
+        with self.bucket_lock:
+            now = time.monotonic()
+            delay = max(0.0, self.paused_until - now)
+            if self.rate > 0:
+                self.tokens = min(BURST, self.tokens + (now - self.updated) * self.rate)
+                self.tokens -= 1
+                if self.tokens < 0:
+                    delay = max(delay, -self.tokens / self.rate)
+            self.updated = now
+            return delay
+
+    def pause(self, seconds):
+        """Приостанавливает запросы к хосту на seconds секунд (Retry-After)"""
+        with self.bucket_lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def release(self, latency=None, overloaded=False):
+        """Освобождает место и подстраивает предел по результату запроса
+
+        latency - время ответа в секундах (None, если ответа не было),
+        overloaded - сайт явно перегружен: 429/503 или таймаут.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if latency is not None and not overloaded:
+                self.latency = latency if self.latency is None else \
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+                # Базовое время ответа - наименьшее среднее, понемногу растущее,
+                # чтобы медленный, но стабильный сайт не считался перегруженным вечно
+                self.base_latency = self.latency if self.base_latency is None else \
+                    min(self.latency, self.base_latency * BASE_LATENCY_DRIFT)
+                overloaded = self.latency > self.base_latency * LATENCY_FACTOR
+            if overloaded:
+                now = time.monotonic()
+                if now - self.last_decrease >= DECREASE_INTERVAL:
+                    self.limit = max(MIN_CONCURRENCY, self.limit * DECREASE_FACTOR)
+                    self.last_decrease = now
+                    self.decreases += 1
+                    logger.debug(f"{self.host}: предел одновременных запросов снижен до {int(self.limit)}")
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                'limit': int(self.limit),
+                'decreases': self.decreases,
+                'rate': self.rate,
+                'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            }
+
+def robots_rate(robots_text, user_agent):
+    """Допустимая частота запросов из robots.txt (запросов в секунду) или None"""
+    parser = RobotFileParser()
+    parser.parse(robots_text.splitlines())
+    rates = []
+    delay = parser.crawl_delay(user_agent)
+    if delay:
+        rates.append(1 / float(delay))
+    request_rate = parser.request_rate(user_agent)
+    if request_rate and request_rate.seconds:
+        rates.append(request_rate.requests / request_rate.seconds)
+    return min(rates) if rates else None
+
+def load_robots_rate(session, scheme, host, user_agent):
+    """Загружает robots.txt хоста и возвращает частоту из него или None"""
+    url = f"{scheme}://{host}/robots.txt"
+    try:
+        response = session.get(url, timeout=ROBOTS_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить {url}: {e}")
+        return None
+    if response.status_code != 200:
+        return None
+    rate = robots_rate(response.text, user_agent)
+    if rate:
+        logger.info(f"{host}: robots.txt ограничивает частоту до {rate:g} запросов в секунду")
+    return rate
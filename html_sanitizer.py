@@ -0,0 +1,97 @@
+"""Очистка HTML описания товара за один разбор
+
+sanitize_description даёт тот же результат, что и цепочка
+parser2.extract_description -> extract_first_paragraph, но вместо трёх
+разборов HTML (lxml в clean_html_tags, html.parser в remove_visterma_text и
+ещё один в extract_first_paragraph) делает один. Разбор через lxml оставлен,
+потому что его нормализация разметки входит в текущий результат; всё
+остальное - удаление атрибутов, отрезание текста о «Вистерме» и поиск
+первого абзаца - выполняется на получившемся дереве за один обход.
+
+Поиск «Вистермы» проверяет только элементы верхнего уровня: первый по
+порядку документа элемент, чей текст содержит фразу, всегда находится на
+верхнем уровне, поэтому get_text для каждого вложенного элемента не нужен.
+"""
+import re
+
+from bs4 import BeautifulSoup, Tag
+
+ALLOWED_TAGS = {'h2', 'h3', 'h4', 'p', 'ul', 'ol', 'li', 'br'}
+VISTERMA_PHRASE = '«Вистерма»'
+VISTERMA_UPPER = 'ВИСТЕРМА'
+SHORT_DESCRIPTION_LIMIT = 150
+
+def _whitelisted_html(desc_block):
+    """Раскрывает теги не из белого списка и возвращает HTML содержимого блока"""
+    for tag in desc_block.find_all(True):
+        if tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+    return "".join(str(child) for child in desc_block.children)
+
+def _cut_visterma_block(soup):
+    """Удаляет первый элемент с фразой «Вистерма» и все элементы после него
+
+    Строки между удалёнными элементами верхнего уровня остаются на месте.
+    """
+    top_level = list(soup.children)
+    for i, element in enumerate(top_level):
+        if isinstance(element, Tag) and VISTERMA_PHRASE in element.get_text():
+            for following in top_level[i:]:
+                if isinstance(following, Tag):
+                    following.decompose()
+            return
+
+def _cut_paragraph_tail(paragraph):
+    """Удаляет фрагмент абзаца после первого <br>, где упоминается Вистерма, вместе с <br>"""
+    for br in paragraph.find_all('br'):
+        next_elements = []
+        current = br.next_sibling
+        while current and current.name != 'br':
+            next_elements.append(current)
+            current = current.next_sibling
+
+        text_after_br = ''.join(str(elem) for elem in next_elements)
+        if VISTERMA_UPPER in text_after_br or VISTERMA_PHRASE in text_after_br:
+            for elem in next_elements:
+                elem.decompose()
+            br.decompose()
+            break
+
+def _short_description(soup, paragraphs):
+    """Текст первого абзаца или, если абзацев нет, начало всего текста"""
+    if paragraphs:
+        return re.sub(r'\s+', ' ', paragraphs[0].get_text().strip())
+    text = soup.get_text().strip()
+    if not text:
+        return ''
+    text = re.sub(r'\s+', ' ', text)
+    if len(text) > SHORT_DESCRIPTION_LIMIT:
+        return text[:SHORT_DESCRIPTION_LIMIT - 3] + '...'
+    return text
+
+def sanitize_description(desc_block):
+    """Возвращает очищенный HTML описания и краткое описание
+
+    desc_block - тег BeautifulSoup со страницы товара (например li#desc) или None.
+    Блок изменяется на месте, как и в parser2.extract_description.
+    """
+    if not desc_block:
+        return '', ''
+    soup = BeautifulSoup(_whitelisted_html(desc_block), 'lxml')
+    if soup.html:
+        soup.html.unwrap()
+    if soup.body:
+        soup.body.unwrap()
+
+    paragraphs = []
+    for tag in soup.find_all(True):
+        tag.attrs = {}
+        if tag.name == 'p':
+            paragraphs.append(tag)
+
+    _cut_visterma_block(soup)
+    paragraphs = [p for p in paragraphs if not p.decomposed]
+    for paragraph in paragraphs:
+        _cut_paragraph_tail(paragraph)
+
+    return str(soup), _short_description(soup, paragraphs)
@@ -0,0 +1,106 @@
+"""Дисковый кэш HTTP-ответов для повторных запусков
+
+Ответы хранятся в SQLite по URL вместе с ETag и Last-Modified. Пока запись
+моложе CACHE_TTL, запрос к сайту не отправляется; после этого http_client
+отправляет условный запрос и при 304 берёт тело из кэша. Когда общий размер
+тел превышает CACHE_MAX_SIZE, удаляются давно не использованные записи.
+"""
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = ".http_cache.sqlite"
+# Сколько секунд ответ считается свежим без обращения к сайту
+CACHE_TTL = 6 * 60 * 60
+# Максимальный суммарный размер сохранённых тел, в байтах
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+
+_connection = None
+_total_size = None
+_lock = threading.Lock()
+
+def _get_connection():
+    global _connection, _total_size
+    if _connection is None:
+        _connection = sqlite3.connect(CACHE_FILE, check_same_thread=False)
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                body BLOB,
+                size INTEGER NOT NULL DEFAULT 0,
+                fetched_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+        _connection.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses(used_at)")
+        _connection.commit()
+        _total_size = _connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    return _connection
+
+def lookup(url):
+    """Возвращает запись кэша для url в виде словаря или None"""
+    with _lock:
+        connection = _get_connection()
+        row = connection.execute(
+            "SELECT etag, last_modified, content_type, body, fetched_at FROM responses WHERE url = ?",
+            (url,)).fetchone()
+        if row is None:
+            return None
+        connection.execute("UPDATE responses SET used_at = ? WHERE url = ?", (time.time(), url))
+        connection.commit()
+    etag, last_modified, content_type, body, fetched_at = row
+    return {
+        'etag': etag,
+        'last_modified': last_modified,
+        'content_type': content_type,
+        'body': body,
+        'fresh': time.time() - fetched_at < CACHE_TTL,
+    }
+
+def conditional_headers(entry):
+    """Заголовки If-None-Match/If-Modified-Since для повторной проверки записи"""
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def store(url, response, body=None):
+    """Сохраняет ответ; body=None означает, что хранятся только валидаторы"""
+    global _total_size
+    size = len(body) if body is not None else 0
+    now = time.time()
+    with _lock:
+        connection = _get_connection()
+        old = connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+             response.headers.get('Content-Type'), body, size, now, now))
+        _total_size += size - (old[0] if old else 0)
+        if _total_size > CACHE_MAX_SIZE:
+            _evict(connection)
+        connection.commit()
+
+def touch(url):
+    """Отмечает запись как заново проверенную после ответа 304"""
+    with _lock:
+        connection = _get_connection()
+        now = time.time()
+        connection.execute("UPDATE responses SET fetched_at = ?, used_at = ? WHERE url = ?", (now, now, url))
+        connection.commit()
+
+def _evict(connection):
+    """Удаляет давно не использованные записи, пока кэш не уменьшится до 90% лимита"""
+    global _total_size
+    target = CACHE_MAX_SIZE * 0.9
+    rows = connection.execute("SELECT url, size FROM responses WHERE size > 0 ORDER BY used_at").fetchall()
+    for url, size in rows:
+        if _total_size <= target:
+            break
+        connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+        _total_size -= size
@@ -0,0 +1,300 @@
+"""Общий HTTP-слой для parser2.py и parser_photo_final.py
+
+Одна сессия requests с пулом keep-alive соединений, таймаутами,
+повторами с экспоненциальной задержкой и счётчиками запросов. Нагрузку
+на каждый хост ограничивает crawl_control.HostLimiter.
+"""
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import crawl_control
+import http_cache
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7"
+}
+# Таймауты на установку соединения и на чтение ответа, в секундах
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+# Сколько раз повторять запрос после ошибки сети, 429 или 5xx
+MAX_RETRIES = 4
+# Базовая и максимальная задержка между повторами, в секундах
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Ответы, после которых уменьшается число одновременных запросов к хосту
+OVERLOAD_STATUSES = {429, 503}
+# Не больше стольких запросов в секунду к одному хосту (0 - без ограничения);
+# Crawl-delay из robots.txt может уменьшить это значение
+REQUESTS_PER_SECOND = 5
+# Использовать дисковый кэш ответов (см. http_cache.py)
+CACHE_ENABLED = True
+# Границы корзин гистограммы времени ответа, в секундах
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10]
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_pool_size = 10
+
+_limiters = {}
+# Хост -> событие «robots.txt загружен и частота применена»
+_robots_loaded = {}
+_limiters_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+stats = {
+    'requests': 0,
+    'retries': 0,
+    'errors': 0,
+    'bytes': 0,
+    'cache_hits': 0,
+    'not_modified': 0,
+    'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+}
+
+def _make_session(pool_size):
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def get_session():
+    """Возвращает общую сессию, создавая её при первом обращении"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _make_session(_pool_size)
+        return _session
+
+def set_pool_size(pool_size):
+    """Задаёт размер пула соединений, обычно равный числу потоков"""
+    global _session, _pool_size
+    with _session_lock:
+        _pool_size = max(1, pool_size)
+        if _session is not None:
+            _session.close()
+        _session = _make_session(_pool_size)
+    with _limiters_lock:
+        _limiters.clear()
+        _robots_loaded.clear()
+
+def get_limiter(url):
+    """Возвращает ограничитель нагрузки для хоста из url, создавая его при первом запросе
+
+    robots.txt загружает поток, создавший ограничитель, без общей блокировки:
+    запросы к другим хостам не ждут его, а запросы к этому хосту ждут, пока
+    не будет применена частота из robots.txt.
+    """
+    parts = urlparse(url)
+    created = False
+    with _limiters_lock:
+        limiter = _limiters.get(parts.netloc)
+        if limiter is None:
+            limiter = crawl_control.HostLimiter(parts.netloc, REQUESTS_PER_SECOND, _pool_size)
+            _limiters[parts.netloc] = limiter
+            _robots_loaded[parts.netloc] = threading.Event()
+            created = True
+        loaded = _robots_loaded[parts.netloc]
+    if not created:
+        loaded.wait()
+        return limiter
+    try:
+        if crawl_control.RESPECT_ROBOTS:
+            robots_rate = crawl_control.load_robots_rate(
+                get_session(), parts.scheme, parts.netloc, HEADERS["User-Agent"])
+            if robots_rate and (REQUESTS_PER_SECOND <= 0 or robots_rate < REQUESTS_PER_SECOND):
+                limiter.set_rate(robots_rate)
+    finally:
+        loaded.set()
+    return limiter
+
+def record_bytes(count):
+    """Учитывает байты, прочитанные из потокового ответа"""
+    with _stats_lock:
+        stats['bytes'] += count
+
+def _record_latency(seconds):
+    bucket = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            bucket = i
+            break
+    with _stats_lock:
+        stats['latency'][bucket] += 1
+
+def _retry_after(response):
+    """Возвращает задержку из заголовка Retry-After в секундах или None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt):
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _cached_response(url, entry, status_code):
+    """Собирает объект Response из записи кэша"""
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    if entry['content_type']:
+        response.headers['Content-Type'] = entry['content_type']
+    response._content = entry['body'] if entry['body'] is not None else b''
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+def fetch(url, stream=False, headers=None, use_cache=True):
+    """Выполняет GET-запрос с повторами и возвращает успешный ответ
+
+    Обычные ответы сохраняются в кэш целиком и при повторном запуске отдаются
+    из него. Для потоковых запросов (stream=True) кэш хранит только
+    валидаторы: ответ со статусом 304 означает, что ранее скачанный файл
+    не изменился, а сохранить валидаторы после успешной записи файла нужно
+    вызовом store_in_cache. Потоковый ответ занимает место в ограничителе
+    хоста, пока его не закроют (with response: ...). При исчерпании попыток
+    выбрасывает исключение requests.
+    """
+    if not (CACHE_ENABLED and use_cache):
+        return _fetch(url, stream, headers)
+
+    entry = http_cache.lookup(url)
+    if entry is not None and not stream and entry['body'] is None:
+        entry = None
+    cached_status = 304 if stream else 200
+    if entry is not None:
+        if entry['fresh']:
+            with _stats_lock:
+                stats['cache_hits'] += 1
+            return _cached_response(url, entry, cached_status)
+        headers = dict(headers or {}, **http_cache.conditional_headers(entry))
+
+    response = _fetch(url, stream, headers)
+    if entry is not None and response.status_code == 304:
+        response.close()
+        http_cache.touch(url)
+        with _stats_lock:
+            stats['not_modified'] += 1
+        return _cached_response(url, entry, cached_status)
+    if not stream:
+        http_cache.store(url, response, response.content)
+    return response
+
+def store_in_cache(url, response):
+    """Запоминает валидаторы потокового ответа, чьё тело было полностью сохранено"""
+    if CACHE_ENABLED and not getattr(response, 'from_cache', False):
+        http_cache.store(url, response)
+
+def _release_on_close(response, limiter, latency, overloaded):
+    """Освобождает место ограничителя при первом закрытии потокового ответа"""
+    close = response.close
+    released = False
+
+    def close_and_release():
+        nonlocal released
+        try:
+            close()
+        finally:
+            if not released:
+                released = True
+                limiter.release(latency, overloaded=overloaded)
+
+    response.close = close_and_release
+
+def _fetch(url, stream, headers):
+    session = get_session()
+    limiter = get_limiter(url)
+    attempt = 0
+    while True:
+        limiter.acquire()
+        with _stats_lock:
+            stats['requests'] += 1
+        started = time.monotonic()
+        try:
+            response = session.get(url, headers=headers, stream=stream,
+                                   timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _record_latency(time.monotonic() - started)
+            limiter.release(overloaded=isinstance(e, requests.Timeout))
+            if attempt >= MAX_RETRIES:
+                with _stats_lock:
+                    stats['errors'] += 1
+                raise
+            delay = _backoff(attempt)
+        except BaseException:
+            limiter.release()
+            raise
+        else:
+            latency = time.monotonic() - started
+            _record_latency(latency)
+            overloaded = response.status_code in OVERLOAD_STATUSES
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                if stream and response.status_code < 400:
+                    # Тело ещё не прочитано: место у хоста занято, пока ответ не закрыт
+                    _release_on_close(response, limiter, latency, overloaded)
+                else:
+                    limiter.release(latency, overloaded=overloaded)
+                if not stream:
+                    record_bytes(len(response.content))
+                if response.status_code >= 400:
+                    with _stats_lock:
+                        stats['errors'] += 1
+                    response.close()
+                response.raise_for_status()
+                return response
+            limiter.release(latency, overloaded=overloaded)
+            delay = _retry_after(response)
+            if delay is None:
+                delay = _backoff(attempt)
+            else:
+                # Сайт сам сказал, сколько ждать: ждут все потоки, а не только этот
+                limiter.pause(min(delay, BACKOFF_MAX))
+            delay = min(delay, BACKOFF_MAX)
+            response.close()
+
+        attempt += 1
+        with _stats_lock:
+            stats['retries'] += 1
+        time.sleep(delay)
+
+def get_stats():
+    """Копия накопленных счётчиков запросов и состояния ограничителей по хостам"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    with _stats_lock:
+        snapshot = dict(stats, latency=list(stats['latency']))
+    snapshot['hosts'] = {limiter.host: limiter.snapshot() for limiter in limiters}
+    return snapshot
+
+def print_stats():
+    """Выводит накопленные счётчики запросов"""
+    snapshot = get_stats()
+    logger.info(f"HTTP: запросов {snapshot['requests']}, повторов {snapshot['retries']}, "
+                f"ошибок {snapshot['errors']}, получено {snapshot['bytes'] / 1024 / 1024:.1f} МБ")
+    logger.info(f"Кэш: отдано без запроса {snapshot['cache_hits']}, не изменилось (304) {snapshot['not_modified']}")
+    labels = [f"<={bound}с" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}с"]
+    logger.info("Время ответа: " + ", ".join(
+        f"{label}: {count}" for label, count in zip(labels, snapshot['latency'])))
+    for host, limiter in snapshot['hosts'].items():
+        logger.info(f"{host}: одновременных запросов в конце {limiter['limit']}, "
+                    f"снижений из-за перегрузки {limiter['decreases']}")
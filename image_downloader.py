@@ -0,0 +1,221 @@
+"""Скачивание изображений товаров с дедупликацией по SHA-256
+
+Изображение скачивается большими кусками во временный файл рядом с целевым
+и атомарно переименовывается только после полной загрузки, поэтому
+прерванная загрузка не оставляет битых файлов. Одинаковые по содержимому
+изображения хранятся на диске один раз: вторая и следующие копии становятся
+жёсткими ссылками на первую (копиями, если папка не поддерживает жёсткие
+ссылки). Если файл с тем же содержимым уже лежит под нужным именем, он не
+перезаписывается. Если сервер сообщил размер (Content-Length) и он совпадает
+с размером уже сохранённого файла, тело ответа не скачивается вовсе.
+
+Хэши файлов папки запоминаются в INDEX_FILE, чтобы при следующем запуске
+не пересчитывать их для неизменившихся файлов.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import http_client
+import metrics
+
+CHUNK_SIZE = 256 * 1024
+INDEX_FILE = ".image_index.json"
+
+# mkstemp создаёт файлы с правами 0600, а изображения должны получать обычные права
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+logger = logging.getLogger(__name__)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+class ImageStore:
+    """Индекс хэшей изображений в одной папке"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.index_path = os.path.join(folder, INDEX_FILE)
+        self.lock = threading.Lock()
+        # имя файла -> {'size', 'mtime', 'sha256'}
+        self.files = {}
+        # sha256 -> имя файла
+        self.by_hash = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    self.files = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать {self.index_path}: {e}")
+        for name, info in list(self.files.items()):
+            if self._is_current(name, info):
+                self.by_hash.setdefault(info['sha256'], name)
+            else:
+                del self.files[name]
+
+    def _is_current(self, name, info):
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return False
+        return stat.st_size == info['size'] and stat.st_mtime == info['mtime']
+
+    def _remember(self, name, sha256):
+        stat = os.stat(os.path.join(self.folder, name))
+        self.files[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256}
+        self.by_hash.setdefault(sha256, name)
+
+    def _forget(self, name):
+        """Убирает из индекса прежнее содержимое файла, который сейчас будет заменён"""
+        info = self.files.pop(name, None)
+        if info and self.by_hash.get(info['sha256']) == name:
+            del self.by_hash[info['sha256']]
+
+    def file_hash(self, name):
+        """SHA-256 файла из индекса или, если файл менялся, посчитанный заново"""
+        info = self.files.get(name)
+        if info and self._is_current(name, info):
+            return info['sha256']
+        digest = hashlib.sha256()
+        with open(os.path.join(self.folder, name), 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        self._remember(name, sha256)
+        return sha256
+
+    def has_size(self, name, size):
+        """Файл name уже сохранён и имеет размер size"""
+        path = os.path.join(self.folder, name)
+        with self.lock:
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                return False
+            # Файл попадает в индекс, чтобы по его хэшу работала дедупликация
+            self.file_hash(name)
+            return True
+
+    def add(self, temp_path, name, sha256, size):
+        """Кладёт скачанный временный файл под именем name и возвращает name"""
+        path = os.path.join(self.folder, name)
+        with self.lock:
+            if os.path.exists(path) and os.path.getsize(path) == size and self.file_hash(name) == sha256:
+                os.remove(temp_path)
+                return name
+
+            existing = self.by_hash.get(sha256)
+            if existing and existing != name and os.path.exists(os.path.join(self.folder, existing)):
+                self._forget(name)
+                link_path = f"{path}.link"
+                try:
+                    os.link(os.path.join(self.folder, existing), link_path)
+                except OSError:
+                    # Жёсткие ссылки не поддерживаются: товар получает свою копию
+                    os.replace(temp_path, path)
+                else:
+                    os.remove(temp_path)
+                    os.replace(link_path, path)
+                self._remember(name, sha256)
+                return name
+
+            self._forget(name)
+            os.replace(temp_path, path)
+            # Если прежняя копия с этим хэшем пропала с диска, основной становится новая
+            self.by_hash[sha256] = name
+            self._remember(name, sha256)
+            return name
+
+    def save(self):
+        with self.lock:
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.files, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+
+def get_store(folder):
+    with _stores_lock:
+        if folder not in _stores:
+            _stores[folder] = ImageStore(folder)
+        return _stores[folder]
+
+def save_index():
+    """Сохраняет индексы хэшей всех папок, куда скачивались изображения"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.save()
+
+def get_image_extension(url, response):
+    """Определяет расширение файла по URL или заголовку Content-Type"""
+    ext = os.path.splitext(url.split('?')[0])[1]
+    if not ext:
+        content_type = response.headers.get('content-type', '')
+        if 'jpeg' in content_type or 'jpg' in content_type:
+            ext = '.jpg'
+        elif 'png' in content_type:
+            ext = '.png'
+        elif 'gif' in content_type:
+            ext = '.gif'
+        elif 'webp' in content_type:
+            ext = '.webp'
+        else:
+            ext = '.jpg'
+    return ext
+
+def download_image(url, filename, folder, headers=None):
+    """Скачивает изображение и возвращает имя сохранённого файла или None
+
+    headers - дополнительные заголовки запроса (из профиля сайта).
+    """
+    store = get_store(folder)
+    temp_path = None
+    started = time.perf_counter()
+    error = None
+    size = 0
+    try:
+        response = http_client.fetch(url, stream=True, headers=headers)
+        if response.status_code == 304:
+            # Изображение не изменилось с прошлого запуска: если файл на месте,
+            # используем его без перезаписи, иначе скачиваем заново
+            full_filename = f"{filename}{get_image_extension(url, response)}"
+            if os.path.exists(os.path.join(folder, full_filename)):
+                return full_filename
+            response = http_client.fetch(url, stream=True, use_cache=False, headers=headers)
+        with response:
+            full_filename = f"{filename}{get_image_extension(url, response)}"
+            expected_size = response.headers.get('Content-Length')
+            # Размер сверяется только для несжатых ответов: iter_content распаковывает gzip
+            if response.headers.get('Content-Encoding'):
+                expected_size = None
+            if expected_size and store.has_size(full_filename, int(expected_size)):
+                # Файл того же размера уже скачан: тело не читаем, соединение закроется вместе с ответом
+                http_client.store_in_cache(url, response)
+                return full_filename
+            digest = hashlib.sha256()
+            fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+            os.chmod(temp_path, FILE_MODE)
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    http_client.record_bytes(len(chunk))
+            if expected_size and int(expected_size) != size:
+                raise IOError(f"получено {size} байт из {expected_size}")
+            saved_name = store.add(temp_path, full_filename, digest.hexdigest(), size)
+            temp_path = None
+            http_client.store_in_cache(url, response)
+            return saved_name
+    except Exception as e:
+        error = e
+        logger.error(f"Ошибка скачивания {url}: {e}")
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        metrics.record('image_download', time.perf_counter() - started, error=error, size=size)
+    return None
@@ -0,0 +1,174 @@
+"""Подготовка скачанных изображений для сайта
+
+Исходные изображения (transform_image_url специально берёт оригиналы без
+resize_cache) остаются в папке как есть, а рядом создаются:
+    web/<имя>.jpg   - уменьшенное до MAX_SIZE и пережатое изображение
+                      (.png, если у изображения есть прозрачность);
+    web/<имя>.webp  - то же в WebP;
+    thumbs/<имя>.jpg - миниатюра THUMBNAIL_SIZE.
+<имя> - имя исходного файла вместе с расширением (web/a.png.jpg), чтобы
+варианты a.jpg и a.png не затирали друг друга.
+EXIF и другие метаданные не копируются; поворот из EXIF применяется
+к самому изображению до их удаления.
+
+Изображения обрабатываются в пуле процессов, чтобы занять все ядра и не
+мешать потокам, которые скачивают страницы. Изображение пропускается, если
+все его варианты новее исходного файла. Одинаковые файлы (жёсткие ссылки,
+см. image_downloader.py) обрабатываются один раз.
+
+Включается переменной ENABLED или запуском отдельно:
+    python image_processing.py [папка]
+"""
+import logging
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageOps
+
+import metrics
+
+ENABLED = False
+WEB_FOLDER = "web"
+THUMBS_FOLDER = "thumbs"
+MAX_SIZE = 1600
+THUMBNAIL_SIZE = 300
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+# Количество процессов; None - по числу ядер
+PROCESS_WORKERS = None
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+logger = logging.getLogger(__name__)
+
+def output_paths(folder, name, has_alpha):
+    """Пути вариантов изображения name: (основной, WebP, миниатюра)"""
+    web = os.path.join(folder, WEB_FOLDER, name)
+    return (f"{web}{'.png' if has_alpha else '.jpg'}",
+            f"{web}.webp",
+            os.path.join(folder, THUMBS_FOLDER, f"{name}.jpg"))
+
+def existing_outputs(folder, name):
+    """Варианты изображения, если все они есть и новее исходного файла, иначе None"""
+    source_mtime = os.path.getmtime(os.path.join(folder, name))
+    for has_alpha in (False, True):
+        paths = output_paths(folder, name, has_alpha)
+        if all(os.path.exists(path) and os.path.getmtime(path) >= source_mtime for path in paths):
+            return paths
+    return None
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+def _save(image, path, **options):
+    """Сохраняет во временный файл и переименовывает, чтобы не оставить недописанный вариант"""
+    temp_path = f"{path}.part"
+    image.save(temp_path, **options)
+    os.replace(temp_path, path)
+
+def process_image(folder, name):
+    """Создаёт варианты одного изображения; выполняется в отдельном процессе
+
+    Возвращает размеры (исходный, основной вариант, WebP) в байтах.
+    """
+    source = os.path.join(folder, name)
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        has_alpha = _has_alpha(image)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        # thumbnail уменьшает с сохранением пропорций и никогда не увеличивает
+        image.thumbnail((MAX_SIZE, MAX_SIZE), Image.LANCZOS)
+
+        main_path, webp_path, thumb_path = output_paths(folder, name, has_alpha)
+        if has_alpha:
+            _save(image, main_path, format='PNG', optimize=True)
+        else:
+            _save(image, main_path, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        _save(image, webp_path, format='WEBP', quality=WEBP_QUALITY, method=6)
+
+        if has_alpha:
+            # У JPEG нет прозрачности, поэтому миниатюра кладётся на белый фон
+            thumbnail = Image.new('RGB', image.size, 'white')
+            thumbnail.paste(image, mask=image.getchannel('A'))
+        else:
+            thumbnail = image.copy()
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        _save(thumbnail, thumb_path, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+
+    return os.path.getsize(source), os.path.getsize(main_path), os.path.getsize(webp_path)
+
+def _link_outputs(folder, source_name, copy_name):
+    """Делает варианты copy_name жёсткими ссылками на варианты одинакового файла source_name"""
+    source_paths = existing_outputs(folder, source_name)
+    has_alpha = source_paths[0].endswith('.png')
+    for source_path, copy_path in zip(source_paths, output_paths(folder, copy_name, has_alpha)):
+        if os.path.exists(copy_path):
+            if os.path.samefile(source_path, copy_path):
+                continue
+            os.remove(copy_path)
+        try:
+            os.link(source_path, copy_path)
+        except OSError:
+            shutil.copyfile(source_path, copy_path)
+
+def find_images(folder):
+    """Группирует изображения папки по файлу на диске: {(устройство, inode): [имена]}"""
+    groups = {}
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        groups.setdefault((stat.st_dev, stat.st_ino), []).append(name)
+    return list(groups.values())
+
+def process_folder(folder):
+    """Обрабатывает все изображения папки и печатает, сколько места сэкономлено"""
+    os.makedirs(os.path.join(folder, WEB_FOLDER), exist_ok=True)
+    os.makedirs(os.path.join(folder, THUMBS_FOLDER), exist_ok=True)
+
+    pending = []
+    skipped = 0
+    for names in find_images(folder):
+        if all(existing_outputs(folder, name) for name in names):
+            skipped += len(names)
+        else:
+            pending.append(names)
+
+    processed = 0
+    errors = 0
+    source_bytes = main_bytes = webp_bytes = 0
+    if pending:
+        logger.info(f"Обработка изображений: {sum(len(names) for names in pending)}, уже готовых: {skipped}")
+        with metrics.stage('image_processing'), ProcessPoolExecutor(max_workers=PROCESS_WORKERS) as executor:
+            futures = {executor.submit(process_image, folder, names[0]): names for names in pending}
+            for future in as_completed(futures):
+                names = futures[future]
+                try:
+                    sizes = future.result()
+                    for name in names[1:]:
+                        _link_outputs(folder, names[0], name)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки изображения {names[0]}: {e}")
+                    errors += len(names)
+                    continue
+                processed += len(names)
+                source_bytes += sizes[0] * len(names)
+                main_bytes += sizes[1] * len(names)
+                webp_bytes += sizes[2] * len(names)
+
+    if source_bytes:
+        logger.info(f"Изображений обработано: {processed}, пропущено: {skipped}, ошибок: {errors}. "
+                    f"Размер {source_bytes / 1024 / 1024:.1f} МБ -> {main_bytes / 1024 / 1024:.1f} МБ "
+                    f"(WebP {webp_bytes / 1024 / 1024:.1f} МБ), сэкономлено "
+                    f"{(source_bytes - main_bytes) / 1024 / 1024:.1f} МБ")
+    else:
+        logger.info(f"Изображений обработано: {processed}, пропущено: {skipped}, ошибок: {errors}")
+    return processed, skipped, errors
+
+if __name__ == "__main__":
+    import parser_photo_final
+    metrics.configure_logging()
+    process_folder(sys.argv[1] if len(sys.argv) > 1 else parser_photo_final.OUTPUT_FOLDER)
@@ -0,0 +1,172 @@
+"""Замеры этапов работы парсеров, отчёт о запуске и настройка логирования
+
+Каждый этап (загрузка каталога, загрузка страницы, разбор, очистка описания,
+скачивание изображения, запись CSV) оборачивается в stage(): для него
+копятся длительности, ошибки по типу исключения и объём данных. В конце
+запуска write_report сохраняет в RUN_REPORT_FILE JSON с перцентилями времени,
+пропускной способностью и счётчиками http_client и выводит краткую сводку
+в лог.
+
+Длительности хранятся целиком, чтобы перцентили были точными: это несколько
+чисел на товар, что несопоставимо с памятью под сами данные товаров.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+import http_client
+
+RUN_REPORT_FILE = "run_report.json"
+PROFILE_FILE = "profile.prof"
+PERCENTILES = (50, 90, 99)
+LOG_FORMAT = "%(message)s"
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stages = {}
+_started = time.time()
+
+def configure_logging(level='INFO'):
+    """Направляет логи всех модулей в консоль; сообщения выглядят как прежние print()"""
+    logging.basicConfig(level=getattr(logging, str(level).upper()), format=LOG_FORMAT)
+
+def _stage_stats(name):
+    if name not in _stages:
+        _stages[name] = {'durations': [], 'errors': {}, 'bytes': 0}
+    return _stages[name]
+
+def record(name, seconds, error=None, size=0):
+    """Учитывает одно выполнение этапа name"""
+    with _lock:
+        stats = _stage_stats(name)
+        stats['durations'].append(seconds)
+        stats['bytes'] += size
+        if error is not None:
+            error_type = type(error).__name__
+            stats['errors'][error_type] = stats['errors'].get(error_type, 0) + 1
+
+def take_stages():
+    """Возвращает и забывает замеры этого процесса (для передачи из процесса пула)"""
+    global _stages
+    with _lock:
+        stages, _stages = _stages, {}
+        return stages
+
+def merge_stages(stages):
+    """Добавляет замеры, полученные из другого процесса"""
+    with _lock:
+        for name, other in stages.items():
+            stats = _stage_stats(name)
+            stats['durations'].extend(other['durations'])
+            stats['bytes'] += other['bytes']
+            for error_type, count in other['errors'].items():
+                stats['errors'][error_type] = stats['errors'].get(error_type, 0) + count
+
+def add_bytes(name, size):
+    """Добавляет байты к этапу name, когда размер известен только после замера"""
+    with _lock:
+        _stage_stats(name)['bytes'] += size
+
+@contextmanager
+def stage(name):
+    """Замеряет время блока как этап name; исключение учитывается и пробрасывается дальше"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        record(name, time.perf_counter() - started, error=e)
+        raise
+    record(name, time.perf_counter() - started)
+
+def _percentile(sorted_values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+def build_report():
+    """Собирает отчёт о запуске в виде словаря"""
+    elapsed = time.time() - _started
+    stages = {}
+    with _lock:
+        snapshot = {name: dict(stats, durations=sorted(stats['durations']), errors=dict(stats['errors']))
+                    for name, stats in _stages.items()}
+    for name, stats in snapshot.items():
+        durations = stats['durations']
+        total = sum(durations)
+        stages[name] = {
+            'count': len(durations),
+            'errors': stats['errors'],
+            'total_seconds': round(total, 4),
+            'mean_ms': round(total / len(durations) * 1000, 3) if durations else 0,
+            **{f'p{p}_ms': round(_percentile(durations, p) * 1000, 3) for p in PERCENTILES},
+            'max_ms': round(durations[-1] * 1000, 3) if durations else 0,
+            # Пропускная способность на всё время запуска, с учётом параллельности
+            'per_second': round(len(durations) / elapsed, 3) if elapsed else 0,
+            'bytes': stats['bytes'],
+        }
+    return {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_started)),
+        'elapsed_seconds': round(elapsed, 3),
+        'stages': stages,
+        'http': http_client.get_stats(),
+    }
+
+def write_report(filename=RUN_REPORT_FILE):
+    """Сохраняет отчёт в JSON и выводит краткую сводку по этапам"""
+    report = build_report()
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(temp_filename, filename)
+
+    logger.info(f"Этапы за {report['elapsed_seconds']:.1f} с:")
+    for name, stats in report['stages'].items():
+        errors = sum(stats['errors'].values())
+        logger.info(f"  {name}: {stats['count']} раз, p50 {stats['p50_ms']:.0f} мс, "
+                    f"p99 {stats['p99_ms']:.0f} мс, ошибок {errors}")
+    logger.info(f"Отчёт о запуске сохранён в {filename}")
+    return report
+
+@contextmanager
+def profiled(enabled, filename=PROFILE_FILE):
+    """Если enabled, профилирует блок cProfile и сохраняет результат в filename
+
+    Сам cProfile видит только поток, в котором включён, поэтому каждому
+    потоку, запущенному внутри блока (пулы страниц и изображений, поиск
+    товаров), заводится свой профиль, и в конце все профили объединяются.
+    """
+    if not enabled:
+        yield
+        return
+    thread_profiles = []
+    profiles_lock = threading.Lock()
+
+    def start_thread_profile(frame, event, arg):
+        profile = cProfile.Profile()
+        with profiles_lock:
+            thread_profiles.append(profile)
+        profile.enable()
+
+    profiler = cProfile.Profile()
+    threading.setprofile(start_thread_profile)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(profiler)
+        with profiles_lock:
+            for profile in thread_profiles:
+                stats.add(profile)
+        stats.dump_stats(filename)
+        logger.info(f"Профиль сохранён в {filename} (смотреть: python -m pstats {filename})")
+        stats.sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,294 @@
+"""Локальная копия сайта для замеров без обращения к visterma.ru
+
+Один раз сохранить страницы и изображения с сайта в fixtures/:
+    python mock_site.py record 50
+Запустить сервер и направить на него скрипты:
+    python mock_site.py serve --products 10000 --latency 50 --error-rate 0.01
+    VISTERMA_BASE_URL=http://127.0.0.1:8000 python parser2.py
+Или замерить скрипт целиком, со своим сервером, во временной папке:
+    python mock_site.py run parser_full --products 2000 --latency 20
+
+Сервер отдаёт раздел каталога с любым путём /catalog/<раздел>/ с пагинацией
+PAGEN_1, как Bitrix, и сколько угодно товаров: каждая страница товара
+собирается из сохранённой страницы (по кругу), в которой заменены название,
+артикул и адрес изображения. Если в fixtures/ ничего нет, используется
+встроенный шаблон и сгенерированное изображение. Задержка ответа, доля
+ошибок 500 и ответов 429 задаются параметрами.
+"""
+import argparse
+import glob
+import io
+import itertools
+import logging
+import mimetypes
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bs4 import BeautifulSoup
+
+import page_parser
+
+# Модули парсеров импортируются внутри функций: parser2 читает
+# VISTERMA_BASE_URL при импорте, а run_script задаёт его перед запуском
+
+FIXTURES_DIR = "fixtures"
+CATALOG_FIXTURE = "catalog.html"
+IMAGES_DIR = "images"
+PAGE_SIZE = 30
+DEFAULT_PRODUCTS = 1000
+PORT = 8000
+
+TITLE = "@@TITLE@@"
+ARTICLE = "@@ARTICLE@@"
+IMAGE = "@@IMAGE@@"
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_PRODUCT = f"""<html><head><meta charset="utf-8"></head><body>
+<h1>{TITLE}</h1>
+<div class="product-item-detail-slider-image active"><img src="{IMAGE}" alt=""></div>
+<ul>
+<li id="desc"><div class="detail"><p>Запасная часть для горелок Weishaupt.<br>Оригинальная деталь производителя.</p>
+<ul><li>Подходит для серий WL и WG</li><li>Поставляется в заводской упаковке</li></ul>
+<p>Компания «Вистерма» поставляет оборудование по всей России.</p></div></li>
+<li id="char"><dl class="psk072"><dt>Артикул:</dt><dd>{ARTICLE}</dd></dl>
+<dl class="psk072"><dt>Производитель:</dt><dd>Weishaupt</dd></dl>
+<dl class="psk072"><dt>Страна:</dt><dd>Германия</dd></dl></li>
+<li id="brand"><p>Weishaupt - немецкий производитель горелок и систем отопления.</p></li>
+</ul></body></html>"""
+
+def record(count, fixtures_dir=FIXTURES_DIR):
+    """Сохраняет страницу каталога, первые count страниц товаров и их изображения"""
+    import catalog_discovery
+    import http_client
+    import parser2
+    import parser_photo_final
+
+    images_dir = os.path.join(fixtures_dir, IMAGES_DIR)
+    os.makedirs(images_dir, exist_ok=True)
+    catalog_url = parser2.catalog_urls()[0]
+    with open(os.path.join(fixtures_dir, CATALOG_FIXTURE), 'w', encoding='utf-8') as f:
+        f.write(http_client.fetch(catalog_url).text)
+    products = catalog_discovery.discover_products([catalog_url])
+    product_urls = [url for url, _ in itertools.islice(products, count)]
+    for i, url in enumerate(product_urls, 1):
+        html = http_client.fetch(url).text
+        with open(os.path.join(fixtures_dir, f"product_{i:04d}.html"), 'w', encoding='utf-8') as f:
+            f.write(html)
+        img_url = parser_photo_final.get_image_url(page_parser.parse_page(html))
+        if not img_url:
+            continue
+        try:
+            response = http_client.fetch(img_url)
+        except Exception as e:
+            logger.error(f"Ошибка скачивания {img_url}: {e}")
+            continue
+        with open(os.path.join(images_dir, f"product_{i:04d}{os.path.splitext(img_url)[1] or '.jpg'}"), 'wb') as f:
+            f.write(response.content)
+    logger.info(f"Сохранено страниц товаров: {len(product_urls)} в {fixtures_dir}")
+
+def make_template(html):
+    """Превращает сохранённую страницу товара в шаблон с метками TITLE, ARTICLE и IMAGE"""
+    soup = BeautifulSoup(html, 'lxml')
+    if soup.h1:
+        soup.h1.string = TITLE
+    specs_block = soup.find('li', id='char')
+    for item in specs_block.find_all('dl', class_='psk072') if specs_block else []:
+        if item.find('dt') and item.find('dt').get_text(strip=True).startswith('Артикул') and item.find('dd'):
+            item.find('dd').string = ARTICLE
+    container = soup.select_one(page_parser.IMAGE_CONTAINER_SELECTOR)
+    img = container.find('img') if container else None
+    if img:
+        img['src'] = IMAGE
+        img.attrs.pop('style', None)
+    return str(soup)
+
+def builtin_image():
+    """Изображение на случай, если в fixtures/ нет сохранённых"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), (200, 210, 220)).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+class MockSite:
+    """Содержимое локального сайта: шаблоны страниц, изображения и настройки"""
+
+    def __init__(self, products=DEFAULT_PRODUCTS, page_size=PAGE_SIZE, latency=0.0,
+                 error_rate=0.0, throttle_rate=0.0, fixtures_dir=FIXTURES_DIR):
+        self.products = products
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.templates = []
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, "product_*.html"))):
+            with open(path, encoding='utf-8') as f:
+                self.templates.append(make_template(f.read()))
+        if not self.templates:
+            self.templates = [BUILTIN_PRODUCT]
+        self.images = []
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, IMAGES_DIR, "*"))):
+            with open(path, 'rb') as f:
+                self.images.append((f.read(), mimetypes.guess_type(path)[0] or 'image/jpeg'))
+        if not self.images:
+            self.images = [(builtin_image(), 'image/jpeg')]
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def catalog_page(self, section_path, number):
+        """Страница раздела; номер больше последнего отдаёт последнюю страницу, как Bitrix"""
+        pages = max(1, -(-self.products // self.page_size))
+        number = min(max(number, 1), pages)
+        first = (number - 1) * self.page_size
+        items = ''.join(
+            f'<div class="c-4"><div class="product-item-container"><div class="psk064">'
+            f'<a class="psk024" href="{section_path}mock-{i}/">Товар {i}</a></div></div></div>'
+            for i in range(first, min(first + self.page_size, self.products)))
+        return (f'<html><head><meta charset="utf-8"></head><body><h1>Тестовый раздел</h1>'
+                f'<div class="catalog-section"><div class="product-item-list-col-3"><div class="row">'
+                f'{items}</div></div></div></body></html>')
+
+    def product_page(self, index):
+        template = self.templates[index % len(self.templates)]
+        image = f"/upload/resize_cache/medialibrary/mock/300_300_1/{index}.jpg"
+        return (template.replace(TITLE, f"Тестовый товар {index}")
+                .replace(ARTICLE, f"MOCK-{index:06d}")
+                .replace(IMAGE, image))
+
+    def image(self, index):
+        return self.images[index % len(self.images)]
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with site.lock:
+                site.requests += 1
+            if site.latency:
+                time.sleep(random.uniform(0.5, 1.5) * site.latency)
+            roll = random.random()
+            if roll < site.throttle_rate:
+                return self.send_body(429, b'', 'text/plain', {'Retry-After': '1'})
+            if roll < site.throttle_rate + site.error_rate:
+                return self.send_body(500, b'', 'text/plain')
+
+            parts = urlsplit(self.path)
+            product = re.match(r'^(/catalog/[^/]+/)mock-(\d+)/$', parts.path)
+            image = re.match(r'^/upload/medialibrary/mock/(\d+)\.\w+$', parts.path)
+            if product and int(product.group(2)) < site.products:
+                self.send_body(200, site.product_page(int(product.group(2))).encode('utf-8'),
+                               'text/html; charset=utf-8')
+            elif re.match(r'^/catalog/[^/]+/$', parts.path):
+                number = int(parse_qs(parts.query).get('PAGEN_1', ['1'])[0])
+                self.send_body(200, site.catalog_page(parts.path, number).encode('utf-8'),
+                               'text/html; charset=utf-8')
+            elif image:
+                body, content_type = site.image(int(image.group(1)))
+                self.send_body(200, body, content_type)
+            else:
+                self.send_body(404, b'', 'text/plain')
+
+    return Handler
+
+def start(site, port=0):
+    """Запускает сервер в фоновом потоке и возвращает его адрес"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def run_script(script, base_url, workdir, script_args, rate=0):
+    """Запускает main() скрипта во workdir против локального сайта и возвращает время в секундах"""
+    # Адрес сайта читается при импорте, поэтому модули загружаются после его установки
+    os.environ["VISTERMA_BASE_URL"] = base_url
+    import importlib
+    import sys
+    import http_client
+
+    http_client.CACHE_ENABLED = False
+    http_client.REQUESTS_PER_SECOND = rate
+    module = importlib.import_module(script)
+    os.chdir(workdir)
+    sys.argv = [script] + script_args
+    started = time.perf_counter()
+    module.main()
+    return time.perf_counter() - started
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Локальная копия сайта для замеров")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="сохранить страницы и изображения с сайта")
+    record_parser.add_argument('count', type=int, help="сколько товаров сохранить")
+
+    for name, help_text in (('serve', "запустить сервер"), ('run', "замерить скрипт на локальном сайте")):
+        command = commands.add_parser(name, help=help_text)
+        if name == 'run':
+            command.add_argument('script', choices=['parser2', 'parser_full', 'parser_photo_final', 'pipeline'])
+            command.add_argument('--workdir', help="где сохранять результаты (по умолчанию временная папка)")
+            command.add_argument('--rate', type=float, default=0,
+                                 help="REQUESTS_PER_SECOND для скрипта (по умолчанию без ограничения)")
+        else:
+            command.add_argument('--port', type=int, default=PORT)
+        command.add_argument('--products', type=int, default=DEFAULT_PRODUCTS, help="сколько товаров в каталоге")
+        command.add_argument('--page-size', type=int, default=PAGE_SIZE, help="товаров на странице каталога")
+        command.add_argument('--latency', type=float, default=0, help="средняя задержка ответа, мс")
+        command.add_argument('--error-rate', type=float, default=0, help="доля ответов 500")
+        command.add_argument('--throttle-rate', type=float, default=0, help="доля ответов 429")
+    for command in commands.choices.values():
+        command.add_argument('--fixtures', default=FIXTURES_DIR, help="папка с сохранёнными страницами")
+    return parser.parse_known_args()
+
+def main():
+    args, script_args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == 'record':
+        record(args.count, args.fixtures)
+        return
+
+    site = MockSite(args.products, args.page_size, args.latency / 1000, args.error_rate,
+                    args.throttle_rate, args.fixtures)
+    logger.info(f"Шаблонов страниц: {len(site.templates)}, изображений: {len(site.images)}, "
+                f"товаров: {site.products}")
+    if args.command == 'serve':
+        server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(site))
+        server.daemon_threads = True
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        logger.info(f"Сайт доступен по адресу {base_url}, запуск скриптов:")
+        logger.info(f"VISTERMA_BASE_URL={base_url} python parser2.py")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    server, base_url = start(site)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mock_run_')
+    os.makedirs(workdir, exist_ok=True)
+    seconds = run_script(args.script, base_url, workdir, script_args, args.rate)
+    server.shutdown()
+    logger.info(f"\n{args.script}: {site.products} товаров за {seconds:.1f} с, "
+                f"{site.products / seconds:.1f} товаров/с, запросов к сайту {site.requests}")
+    logger.info(f"Результаты в {workdir}")
+
+if __name__ == "__main__":
+    main()
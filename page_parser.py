@@ -0,0 +1,202 @@
+"""Разбор страниц каталога и товаров с выбором backend'а
+
+bs4  - BeautifulSoup с парсером lxml, как в исходных скриптах;
+lxml - lxml.html с заранее скомпилированными селекторами. Полный
+       BeautifulSoup для страницы не строится: в bs4 переводится только
+       блок описания, который затем чистит html_sanitizer.
+
+Backend выбирается переменной BACKEND или параметром backend у parse_page.
+На страницах сайта оба backend'а возвращают одинаковые данные; benchmark.py
+проверяет это на сохранённых страницах. Расхождения возможны только на
+сильно испорченной вложенности тегов, которую libxml2 чинит по-разному.
+
+Где на странице искать данные, задают CSS-селекторы (DEFAULT_SELECTORS -
+для visterma.ru, для других сайтов - профили из site_profile.py). Селекторы
+компилируются один раз в объекте Selectors: для lxml - в XPath, для bs4 -
+в аргументы find(), если селектор простой (тег, #id, один класс), иначе
+в soupsieve.
+"""
+import re
+
+from bs4 import BeautifulSoup
+import lxml.html
+import soupsieve
+from cssselect import GenericTranslator
+from lxml import etree
+
+BACKENDS = ('bs4', 'lxml')
+BACKEND = 'bs4'
+
+PRODUCT_ITEM_SELECTOR = '.catalog-section .product-item-list-col-3 .row .c-4 .product-item-container .psk064'
+IMAGE_CONTAINER_SELECTOR = 'div.product-item-detail-slider-image.active'
+
+# Названия 'desc', 'brand' и 'char' - это блоки, которые отдаёт block()
+DEFAULT_SELECTORS = {
+    'product_item': PRODUCT_ITEM_SELECTOR,
+    'product_link': 'a.psk024',
+    'title': 'h1',
+    'desc': 'li#desc',
+    'brand': 'li#brand',
+    'char': 'li#char',
+    'characteristic': 'dl.psk072',
+    'characteristic_name': 'dt',
+    'characteristic_value': 'dd',
+    'image_container': IMAGE_CONTAINER_SELECTOR,
+    'image': 'img',
+}
+
+_translator = GenericTranslator()
+_simple_selector = re.compile(r'^(?P<tag>[\w-]+)?(?:#(?P<id>[\w-]+))?(?P<classes>(?:\.[\w-]+)*)$')
+
+class _Bs4Selector:
+    """CSS-селектор для BeautifulSoup: простой - через find(), остальные - через soupsieve"""
+
+    def __init__(self, css):
+        match = _simple_selector.match(css)
+        classes = match.group('classes').split('.')[1:] if match else []
+        self.compiled = None
+        if not match or not (match.group('tag') or match.group('id') or classes) or len(classes) > 1:
+            self.compiled = soupsieve.compile(css)
+            return
+        self.name = match.group('tag')
+        self.attrs = {}
+        if match.group('id'):
+            self.attrs['id'] = match.group('id')
+        if classes:
+            self.attrs['class_'] = classes[0]
+
+    def first(self, tag):
+        if self.compiled is not None:
+            return self.compiled.select_one(tag)
+        return tag.find(self.name, **self.attrs)
+
+    def all(self, tag):
+        if self.compiled is not None:
+            return self.compiled.select(tag)
+        return tag.find_all(self.name, **self.attrs)
+
+class Selectors:
+    """Набор скомпилированных селекторов страницы
+
+    css - словарь с теми же ключами, что DEFAULT_SELECTORS; отсутствующие
+    ключи берутся из DEFAULT_SELECTORS.
+    """
+
+    def __init__(self, css=None):
+        unknown = set(css or {}) - set(DEFAULT_SELECTORS)
+        if unknown:
+            raise ValueError(f"Неизвестные селекторы: {', '.join(sorted(unknown))}")
+        self.css = dict(DEFAULT_SELECTORS, **(css or {}))
+        self.bs4 = {}
+        self.lxml = {}
+        for name, css in self.css.items():
+            try:
+                self.bs4[name] = _Bs4Selector(css)
+                # Поиск только среди потомков, как у find() в BeautifulSoup
+                self.lxml[name] = etree.XPath(_translator.css_to_xpath(css, prefix='descendant::'))
+            except Exception as e:
+                raise ValueError(f"Ошибка в селекторе {name} «{css}»: {e}") from e
+
+    def lxml_first(self, name, element):
+        found = self.lxml[name](element)
+        return found[0] if found else None
+
+DEFAULT = Selectors()
+
+def _text(element):
+    """Аналог get_text(strip=True) из BeautifulSoup"""
+    return ''.join(part.strip() for part in element.itertext())
+
+class Bs4Page:
+    """Страница, разобранная BeautifulSoup"""
+
+    def __init__(self, html, selectors=None):
+        self.soup = BeautifulSoup(html, 'lxml')
+        self.selectors = (selectors or DEFAULT).bs4
+
+    def product_links(self):
+        links = []
+        for item in self.selectors['product_item'].all(self.soup):
+            link = self.selectors['product_link'].first(item)
+            if link and link.get('href'):
+                links.append(link['href'])
+        return links
+
+    def title(self):
+        h1 = self.selectors['title'].first(self.soup)
+        return h1.get_text(strip=True) if h1 else None
+
+    def block(self, block_id):
+        """Блок страницы ('desc', 'brand' или 'char') в виде тега BeautifulSoup"""
+        return self.selectors[block_id].first(self.soup)
+
+    def characteristics(self):
+        specs = {}
+        specs_block = self.block('char')
+        if specs_block:
+            for item in self.selectors['characteristic'].all(specs_block):
+                name = self.selectors['characteristic_name'].first(item).get_text(strip=True).replace(':', '')
+                value = self.selectors['characteristic_value'].first(item).get_text(strip=True)
+                specs[name] = value
+        return specs
+
+    def image_attributes(self):
+        """Атрибуты src и style основного изображения товара"""
+        img_container = self.selectors['image_container'].first(self.soup)
+        img_tag = self.selectors['image'].first(img_container) if img_container else None
+        if not img_tag:
+            return None, None
+        return img_tag.get('src'), img_tag.get('style')
+
+class LxmlPage:
+    """Страница, разобранная lxml.html"""
+
+    def __init__(self, html, selectors=None):
+        self.root = lxml.html.document_fromstring(html)
+        self.selectors = selectors or DEFAULT
+
+    def product_links(self):
+        links = []
+        for item in self.selectors.lxml['product_item'](self.root):
+            link = self.selectors.lxml_first('product_link', item)
+            if link is not None and link.get('href'):
+                links.append(link.get('href'))
+        return links
+
+    def title(self):
+        found = self.selectors.lxml_first('title', self.root)
+        return _text(found) if found is not None else None
+
+    def block(self, block_id):
+        found = self.selectors.lxml_first(block_id, self.root)
+        if found is None:
+            return None
+        html = lxml.html.tostring(found, encoding='unicode', with_tail=False)
+        return BeautifulSoup(html, 'lxml').find(found.tag)
+
+    def characteristics(self):
+        specs = {}
+        found = self.selectors.lxml_first('char', self.root)
+        if found is not None:
+            for item in self.selectors.lxml['characteristic'](found):
+                # Как и в bs4-версии, элемент без названия или значения приводит к ошибке разбора страницы
+                name = _text(self.selectors.lxml['characteristic_name'](item)[0]).replace(':', '')
+                value = _text(self.selectors.lxml['characteristic_value'](item)[0])
+                specs[name] = value
+        return specs
+
+    def image_attributes(self):
+        container = self.selectors.lxml_first('image_container', self.root)
+        image = self.selectors.lxml_first('image', container) if container is not None else None
+        if image is None:
+            return None, None
+        return image.get('src'), image.get('style')
+
+def parse_page(html, backend=None, selectors=None):
+    """Разбирает HTML выбранным backend'ом с селекторами selectors (по умолчанию DEFAULT)"""
+    backend = backend or BACKEND
+    if backend == 'bs4':
+        return Bs4Page(html, selectors)
+    if backend == 'lxml':
+        return LxmlPage(html, selectors)
+    raise ValueError(f"Неизвестный backend разбора: {backend}")
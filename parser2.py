@@ -1,16 +1,72 @@
-import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-import time
+import argparse
 import csv
+import itertools
+import logging
+import os
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+import brand_cache
+import catalog_discovery
+import change_tracker
+import columnar_export
+import html_sanitizer
+import http_client
+import metrics
+import page_parser
+import site_profile
+
+# Адрес сайта; переменная окружения VISTERMA_BASE_URL позволяет направить
+# все скрипты на локальную копию (см. mock_site.py)
+BASE_URL = os.environ.get("VISTERMA_BASE_URL", "https://visterma.ru").rstrip('/')
+# Разделы каталога: пути относительно BASE_URL или полные адреса;
+# каждый раздел обходится постранично (см. catalog_discovery.py)
+CATALOG_URLS = ["/catalog/prochee-Weishaupt/"]
+# sitemap.xml, из которого тоже брать ссылки на товары (None - не использовать)
+SITEMAP_URL = None
+CSV_FILE = "visterma_products.csv"
+# Сколько характеристик попадает в колонки атрибутов CSV
+MAX_ATTRIBUTES = 7
+# Колонки CSV характеристик в длинном формате: строка на характеристику товара
+CHARACTERISTICS_FIELDNAMES = ['Артикул', 'Имя', 'Характеристика', 'Значение']
+CHARACTERISTICS_SUFFIX = "_characteristics"
+# Выгружать CSV в Parquet после обхода (см. columnar_export.py)
+EXPORT_PARQUET = False
+# Количество одновременно обрабатываемых страниц товаров
+MAX_WORKERS = 10
+# Сколько товаров может одновременно находиться в обработке и ждать записи
+WINDOW = MAX_WORKERS * 4
+
+logger = logging.getLogger(__name__)
 
-BASE_URL = "https://visterma.ru"
-CATALOG_URL = "https://visterma.ru/catalog/prochee-Weishaupt/?SHOWALL_1=1"
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7"
-}
+@dataclass(slots=True)
+class Product:
+    """Данные одного товара
+
+    Одинаковые для всех товаров колонки CSV (ID, Тип, Опубликован...) здесь
+    не хранятся и подставляются при записи в prepare_csv_row.
+    """
+    name: str
+    article: str = ''
+    description: str = ''
+    short_description: str = ''
+    category: str = ''
+    image: str = ''
+    # Ключ производителя в brand_cache
+    manufacturer: str = None
+    characteristics: dict = field(default_factory=dict)
+
+    def attributes(self):
+        """Пары (название, значение) для колонок атрибутов CSV
+
+        Берутся первые MAX_ATTRIBUTES характеристик без артикула и названия;
+        все характеристики пишутся в CSV характеристик (см. CsvCheckpointWriter).
+        """
+        return [(name, value) for name, value in itertools.islice(self.characteristics.items(), MAX_ATTRIBUTES)
+                if name.lower() not in ('артикул', 'название')]
 
 def clean_html_tags(html):
     soup = BeautifulSoup(html, 'lxml')
@@ -67,7 +123,7 @@ def remove_visterma_text(html_content):
         return str(soup)
             
     except Exception as e:
-        print(f"Ошибка при удалении текста Вистермы: {e}")
+        logger.error(f"Ошибка при удалении текста Вистермы: {e}")
         return html_content
 
 def extract_first_paragraph(html_content):
@@ -99,7 +155,7 @@ def extract_first_paragraph(html_content):
             return ''
             
     except Exception as e:
-        print(f"Ошибка при извлечении первого абзаца: {e}")
+        logger.error(f"Ошибка при извлечении первого абзаца: {e}")
         return ''
 
 def extract_description(desc_block):
@@ -118,176 +174,338 @@ def extract_description(desc_block):
     
     return cleaned_description
 
-def get_characteristics(soup):
-    specs = {}
-    specs_block = soup.find('li', id='char')
-    if specs_block:
-        for item in specs_block.find_all('dl', class_='psk072'):
-            name = item.find('dt').get_text(strip=True).replace(':', '')
-            value = item.find('dd').get_text(strip=True)
-            specs[name] = value
-    return specs
-
-def get_all_product_links(catalog_url):
-    try:
-        response = requests.get(catalog_url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-        product_links = []
-        
-        product_items = soup.select('.catalog-section .product-item-list-col-3 .row .c-4 .product-item-container .psk064')
-        
-        for item in product_items:
-            link = item.find('a', class_='psk024')
-            if link and link.get('href'):
-                full_url = urljoin(BASE_URL, link['href'])
-                product_links.append(full_url)
-        print(f"Найдено {len(product_links)} товаров")
-        return product_links
-    except Exception as e:
-        print(f"Ошибка при получении ссылок на товары: {e}")
-        return []
+def fetch_product_page(url, profile=None):
+    """Скачивает и разбирает страницу товара, замеряя оба этапа"""
+    with metrics.stage('page_fetch'):
+        response = http_client.fetch(url, headers=profile.headers if profile else None)
+    if not getattr(response, 'from_cache', False):
+        metrics.add_bytes('page_fetch', len(response.content))
+    with metrics.stage('parse'):
+        return page_parser.parse_page(response.text, selectors=profile.selectors if profile else None)
+
+def catalog_urls(urls=None):
+    """Полные адреса разделов каталога из urls или CATALOG_URLS"""
+    return [urljoin(BASE_URL, url) for url in (urls or CATALOG_URLS)]
 
-def get_manufacturer_info(first_product_url):
+def profiles_from_args(args, output_folder=None):
+    """Профили сайтов из --site или профиль visterma.ru из настроек этого файла"""
+    if args.site:
+        return [site_profile.load(path) for path in args.site]
+    return [site_profile.SiteProfile('visterma', BASE_URL, catalog_urls(args.catalog), args.sitemap,
+                                     CSV_FILE, output_folder)]
+
+def parse_product_page(url, category='', profile=None):
     try:
-        response = requests.get(first_product_url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-        return extract_description(soup.find('li', id='brand'))
+        page = fetch_product_page(url, profile)
+        return parse_product_document(page, category)
     except Exception as e:
-        print(f"Ошибка при получении информации о производителе: {e}")
-        return "Нет информации"
+        logger.error(f"Ошибка при парсинге {url}: {e}")
+        return None
 
-def parse_product_page(url, manufacturer_info):
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
+def parse_product_document(page, category=''):
+    """Собирает данные товара из уже разобранной страницы (см. page_parser)
 
-        title = soup.find('h1').get_text(strip=True) if soup.find('h1') else 'Нет названия'
-        description = extract_description(soup.find('li', id='desc'))
-        characteristics = get_characteristics(soup)
-        
+    Возвращает Product; вместо информации о производителе в нём ключ из brand_cache.
+    """
+    title = page.title()
+    if title is None:
+        title = 'Нет названия'
+    # Описание и его первый абзац для краткого описания получаем за один разбор
+    with metrics.stage('description'):
+        description, short_description = html_sanitizer.sanitize_description(page.block('desc'))
+    characteristics = page.characteristics()
+    
+    return Product(
+        name=title,
         # Извлекаем артикул из характеристик
-        article = characteristics.get('Артикул', '')
-        
-        # Извлекаем первый абзац из описания для краткого описания
-        short_description = extract_first_paragraph(description)
-
-        # Формируем список атрибутов (максимум 7)
-        attributes = []
-        for i, (name, value) in enumerate(list(characteristics.items())[:7]):
-            if name.lower() != 'артикул' and name.lower() != 'название':
-                attributes.append({
-                    'name': name,
-                    'value': value,
-                    'visible': 1,
-                    'global': 0
-                })
-
-        product_data = {
-            'ID': 5000,
-            'Тип': 'simple',
-            'Артикул': article,
-            'Имя': title,
-            'Опубликован': 1,
-            'Видимость в каталоге': 'visible',
-            'Краткое описание': short_description,
-            'Описание': description,
-            'Наличие': 1,
-            'Базовая цена': 0,
-            'Категории': '',
-            'Изображения': '',
-            'manufacturer': manufacturer_info,
-            'characteristics': characteristics,
-            'attributes': attributes
-        }
-        
-        return product_data
-        
-    except Exception as e:
-        print(f"Ошибка при парсинге {url}: {e}")
-        return None
+        article=characteristics.get('Артикул', ''),
+        description=description,
+        short_description=short_description,
+        category=category,
+        manufacturer=brand_cache.get_cache().resolve(page, characteristics),
+        characteristics=characteristics,
+    )
 
 def prepare_csv_row(product):
-    """Подготавливает строку для CSV файла"""
-    row = {
-        'ID': product['ID'],
-        'Тип': product['Тип'],
-        'Артикул': product['Артикул'],
-        'Имя': product['Имя'],
-        'Опубликован': product['Опубликован'],
-        'Видимость в каталоге': product['Видимость в каталоге'],
-        'Краткое описание': product['Краткое описание'],
-        'Описание': product['Описание'],
-        'Наличие': product['Наличие'],
-        'Базовая цена': product['Базовая цена'],
-        'Категории': product['Категории'],
-        'Изображения': product['Изображения']
-    }
+    """Подготавливает строку CSV в порядке get_csv_fieldnames()"""
+    row = [
+        5000,                   # ID
+        'simple',               # Тип
+        product.article,
+        product.name,
+        1,                      # Опубликован
+        'visible',              # Видимость в каталоге
+        product.short_description,
+        product.description,
+        1,                      # Наличие
+        0,                      # Базовая цена
+        product.category,
+        product.image,
+    ]
     
-    # Добавляем атрибуты (до 7 возможных)
-    for i, attr in enumerate(product['attributes'][:7], 1):
-        row[f'Название атрибута {i}'] = attr['name']
-        row[f'Значения атрибутов {i}'] = attr['value']
-        row[f'Видимость атрибута {i}'] = attr['visible']
-        row[f'Глобальный атрибут {i}'] = attr['global']
+    # Атрибуты: название, значение, видимость, глобальный
+    attributes = product.attributes()
+    for name, value in attributes:
+        row.extend((name, value, 1, 0))
     
     # Заполняем оставшиеся атрибуты пустыми значениями
-    for i in range(len(product['attributes']) + 1, 8):
-        row[f'Название атрибута {i}'] = ''
-        row[f'Значения атрибутов {i}'] = ''
-        row[f'Видимость атрибута {i}'] = ''
-        row[f'Глобальный атрибут {i}'] = ''
-    
+    row.extend([''] * 4 * (MAX_ATTRIBUTES - len(attributes)))
     return row
 
-def main():
-    print("Сбор ссылок на все товары...")
-    product_urls = get_all_product_links(CATALOG_URL)
-    
-    if not product_urls:
-        print("Не удалось найти товары в каталоге")
-        return
-    
-    print("\nПолучение информации о производителе...")
-    manufacturer_info = get_manufacturer_info(product_urls[0])
-    print("Информация о производителе получена")
-    
-    print("\nНачало парсинга товаров...")
-    all_products = []
-    
-    for i, url in enumerate(product_urls, 1):
-        print(f"Обработка товара {i}/{len(product_urls)}...")
-        product_data = parse_product_page(url, manufacturer_info)
-        if product_data:
-            all_products.append(product_data)
-        # time.sleep(1)
-    
-    # Определяем заголовки CSV файла
+def get_csv_fieldnames():
+    """Возвращает заголовки CSV файла"""
     fieldnames = [
         'ID', 'Тип', 'Артикул', 'Имя', 'Опубликован', 'Видимость в каталоге',
         'Краткое описание', 'Описание', 'Наличие', 'Базовая цена', 'Категории', 'Изображения'
     ]
     
     # Добавляем колонки для атрибутов
-    for i in range(1, 8):
+    for i in range(1, MAX_ATTRIBUTES + 1):
         fieldnames.extend([
             f'Название атрибута {i}',
             f'Значения атрибутов {i}',
             f'Видимость атрибута {i}',
             f'Глобальный атрибут {i}'
         ])
+    return fieldnames
+
+def characteristics_filename(csv_file):
+    """visterma_products.csv -> visterma_products_characteristics.csv"""
+    base, ext = os.path.splitext(csv_file)
+    return f"{base}{CHARACTERISTICS_SUFFIX}{ext}"
+
+class CsvCheckpointWriter:
+    """Пишет строки в CSV по мере готовности и ведёт журнал обработанных URL
+
+    Рядом с основным CSV пишется CSV характеристик (characteristics_filename)
+    в длинном формате: все характеристики товара, а не только первые
+    MAX_ATTRIBUTES, по строке на характеристику.
+
+    Каждая строка журнала - размеры обоих CSV файлов после обработки URL и
+    сам URL. При продолжении (resume=True) файлы обрезаются до последней
+    записи журнала, обработанные URL пропускаются, а новые строки
+    дописываются в конец. URL, которые не удалось обработать, в done_urls не
+    попадают и при продолжении обрабатываются ещё раз. После успешного
+    завершения журнал удаляется.
+
+    row_urls - URL товара каждой строки CSV по порядку, failed_urls - URL,
+    которые не удалось обработать; по ним change_tracker отличает товары,
+    пропавшие с сайта, от страниц, не загрузившихся в этот раз.
+    """
+
+    def __init__(self, filename, resume=False):
+        self.filename = filename
+        self.characteristics_filename = characteristics_filename(filename)
+        self.checkpoint_file = filename + '.checkpoint'
+        self.done_urls = set()
+        self.row_urls = []
+        self.failed_urls = set()
+        offsets = None
+        if resume and os.path.exists(self.checkpoint_file) and os.path.exists(filename):
+            offsets = self._read_checkpoint()
+
+        if offsets is not None:
+            offset, characteristics_offset = offsets
+            with open(filename, 'r+b') as f:
+                f.truncate(offset)
+            self.csvfile = open(filename, 'a', newline='', encoding='utf-8-sig')
+            self.writer = csv.writer(self.csvfile)
+            if characteristics_offset is not None and os.path.exists(self.characteristics_filename):
+                with open(self.characteristics_filename, 'r+b') as f:
+                    f.truncate(characteristics_offset)
+                self.characteristics_file = open(self.characteristics_filename, 'a', newline='',
+                                                 encoding='utf-8-sig')
+                self.characteristics_writer = csv.writer(self.characteristics_file)
+            else:
+                # Журнал от версии без CSV характеристик: характеристики уже
+                # обработанных товаров в него не попадут
+                self._open_characteristics()
+            self.journal = open(self.checkpoint_file, 'a', encoding='utf-8')
+            logger.info(f"Продолжение с контрольной точки: уже обработано {len(self.done_urls)} товаров")
+        else:
+            self.csvfile = open(filename, 'w', newline='', encoding='utf-8-sig')
+            self.writer = csv.writer(self.csvfile)
+            self.writer.writerow(get_csv_fieldnames())
+            self.csvfile.flush()
+            self._open_characteristics()
+            self.journal = open(self.checkpoint_file, 'w', encoding='utf-8')
+            self._write_journal('')
+
+    def _open_characteristics(self):
+        self.characteristics_file = open(self.characteristics_filename, 'w', newline='', encoding='utf-8-sig')
+        self.characteristics_writer = csv.writer(self.characteristics_file)
+        self.characteristics_writer.writerow(CHARACTERISTICS_FIELDNAMES)
+        self.characteristics_file.flush()
+
+    def _read_checkpoint(self):
+        """Читает журнал и возвращает размеры обоих CSV на момент последней полной записи"""
+        with open(self.checkpoint_file, 'r+b') as journal:
+            data = journal.read()
+            # Незавершённая последняя строка означает прерванную запись, отбрасываем её
+            complete = data[:data.rfind(b'\n') + 1]
+            journal.truncate(len(complete))
+        offsets = None
+        for line in complete.decode('utf-8').splitlines():
+            sizes, url = line.split('\t', 1)
+            size, _, characteristics_size = sizes.partition(',')
+            # CSV вырос - по URL записана строка, иначе товар обработать не удалось
+            written = offsets is not None and int(size) > offsets[0]
+            offsets = int(size), int(characteristics_size) if characteristics_size else None
+            if url:
+                self._mark(url, written)
+        return offsets
+
+    def row_images(self):
+        """Пары (URL товара, имя файла изображения) для уже записанных строк CSV
+
+        Нужны при продолжении, чтобы имена изображений обработанных товаров
+        не достались товарам, которые обработаются сейчас.
+        """
+        if not self.row_urls:
+            return []
+        self.csvfile.flush()
+        column = get_csv_fieldnames().index('Изображения')
+        with open(self.filename, newline='', encoding='utf-8-sig') as f:
+            rows = csv.reader(f)
+            next(rows, None)
+            return [(url, row[column]) for url, row in zip(self.row_urls, rows)]
+
+    def write(self, url, product):
+        """Записывает товар (или отмечает URL без данных, если product is None)"""
+        with metrics.stage('csv_write'):
+            if product:
+                self.writer.writerow(prepare_csv_row(product))
+                self.characteristics_writer.writerows(
+                    (product.article, product.name, name, value)
+                    for name, value in product.characteristics.items())
+                self.csvfile.flush()
+                self.characteristics_file.flush()
+            self._write_journal(url)
+        self._mark(url, bool(product))
+
+    def _mark(self, url, written):
+        if written:
+            self.done_urls.add(url)
+            self.row_urls.append(url)
+            self.failed_urls.discard(url)
+        else:
+            self.failed_urls.add(url)
+
+    def _write_journal(self, url):
+        sizes = f"{os.fstat(self.csvfile.fileno()).st_size},{os.fstat(self.characteristics_file.fileno()).st_size}"
+        self.journal.write(f"{sizes}\t{url}\n")
+        self.journal.flush()
+
+    def close(self, completed=True):
+        self.csvfile.close()
+        self.characteristics_file.close()
+        self.journal.close()
+        if completed:
+            os.remove(self.checkpoint_file)
+
+def iter_ordered(executor, func, items, window):
+    """Выполняет func для items в пуле и отдаёт пары (item, результат) в исходном порядке
+
+    Одновременно в работе не больше window задач, поэтому items может быть
+    бесконечным потоком, а память не растёт с размером каталога.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, executor.submit(func, item)))
+        if len(pending) >= window:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+    while pending:
+        done_item, future = pending.popleft()
+        yield done_item, future.result()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сбор описаний и характеристик товаров в CSV")
+    parser.add_argument('--resume', action='store_true',
+                        help="продолжить прерванный запуск, пропустив уже обработанные товары")
+    parser.add_argument('--catalog', action='append', metavar='URL',
+                        help="раздел каталога для обхода, можно указать несколько раз "
+                             "(по умолчанию CATALOG_URLS)")
+    parser.add_argument('--sitemap', metavar='URL', default=SITEMAP_URL,
+                        help="sitemap.xml, из которого тоже брать ссылки на товары")
+    parser.add_argument('--site', action='append', metavar='PROFILE',
+                        help="профиль сайта (JSON или YAML, см. site_profile.py), можно указать "
+                             "несколько раз; заменяет --catalog и --sitemap")
+    parser.add_argument('--backend', choices=page_parser.BACKENDS, default=page_parser.BACKEND,
+                        help="чем разбирать HTML страниц (по умолчанию %(default)s)")
+    parser.add_argument('--parquet', action='store_true', default=EXPORT_PARQUET,
+                        help="после обхода выгрузить CSV товаров и характеристик в Parquet (нужен pyarrow)")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="подробность вывода; DEBUG показывает каждый товар")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"профилировать запуск через cProfile и сохранить профиль в {metrics.PROFILE_FILE}")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    metrics.configure_logging(args.log_level)
+    try:
+        with metrics.profiled(args.profile):
+            run(args)
+    finally:
+        # Отчёт нужен и после сбоя или Ctrl-C
+        metrics.write_report()
+
+def export_parquet(csv_file):
+    """Выгружает CSV товаров и характеристик в Parquet, если это включено"""
+    if EXPORT_PARQUET:
+        columnar_export.export([csv_file, characteristics_filename(csv_file)])
+
+def run(args):
+    global EXPORT_PARQUET
+    page_parser.BACKEND = args.backend
+    EXPORT_PARQUET = args.parquet
+    http_client.set_pool_size(MAX_WORKERS)
+    try:
+        for profile in profiles_from_args(args):
+            crawl(profile, args.resume)
+    finally:
+        brand_cache.save()
+    http_client.print_stats()
+
+def crawl(profile, resume=False):
+    """Собирает товары одного сайта в profile.csv_file"""
+    logger.info(f"Сбор ссылок на все товары ({profile.name})...")
+    incomplete = []
+    products = catalog_discovery.discover_in_background(profile.catalog_urls, profile.sitemap_url, profile,
+                                                        incomplete)
+    first = next(products, None)
     
-    # Сохраняем в CSV
-    with open('visterma_products.csv', 'w', newline='', encoding='utf-8-sig') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for product in all_products:
-            writer.writerow(prepare_csv_row(product))
+    if first is None:
+        logger.warning(f"Не удалось найти товары в каталоге ({profile.name})")
+        return
+    
+    logger.info("\nНачало парсинга товаров...")
+    output = CsvCheckpointWriter(profile.csv_file, resume=resume)
+    pending = (item for item in itertools.chain([first], products) if item[0] not in output.done_urls)
+    completed = False
+    
+    # Ссылки на товары поступают, пока ещё обходится каталог. Страницы
+    # скачиваются параллельно, но iter_ordered отдаёт результаты в порядке
+    # обнаружения, поэтому порядок строк в CSV не меняется
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    try:
+        results = iter_ordered(executor,
+                               lambda item: parse_product_page(item[0], item[1], profile),
+                               pending, WINDOW)
+        for i, ((url, category), product_data) in enumerate(results, 1):
+            logger.debug(f"Обработка товара {i}...")
+            output.write(url, product_data)
+        completed = True
+    finally:
+        # При прерывании не ждём оставшиеся страницы: их обработает --resume
+        executor.shutdown(cancel_futures=True)
+        output.close(completed)
     
-    print("\nДанные успешно сохранены в visterma_products.csv")
+    # Изменения выгрузит parser_photo_final.py, когда впишет изображения
+    change_tracker.save_run(profile.csv_file, output.row_urls, output.failed_urls, incomplete)
+    logger.info(f"\nДанные успешно сохранены в {profile.csv_file}")
+    export_parquet(profile.csv_file)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""Собирает описание, атрибуты и фото товаров за один проход
+
+Каждая страница товара скачивается и разбирается один раз: из одной разобранной
+страницы берутся название, описание, характеристики и ссылка на изображение.
+Изображения скачиваются в отдельном пуле потоков, пока разбираются
+следующие страницы, а CSV сразу получается с заполненной колонкой «Изображения».
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import logging
+import brand_cache
+import catalog_discovery
+import change_tracker
+import http_client
+import image_downloader
+import image_processing
+import metrics
+import parser2
+import page_parser
+import parser_photo_final
+
+CSV_FILE = parser2.CSV_FILE
+OUTPUT_FOLDER = parser_photo_final.OUTPUT_FOLDER
+# Потоки для страниц товаров и для изображений
+MAX_WORKERS = 10
+IMAGE_WORKERS = 10
+
+logger = logging.getLogger(__name__)
+
+def process_product(url, category='', profile=None):
+    """Разбирает страницу товара
+
+    Возвращает пару (данные товара, (название для имени файла, URL изображения)
+    или None, если изображения нет).
+    """
+    try:
+        page = parser2.fetch_product_page(url, profile)
+        product_data = parser2.parse_product_document(page, category)
+        sanitized_name, img_url, original_name = parser_photo_final.get_name_and_image(page, url)
+    except Exception as e:
+        logger.error(f"Ошибка при парсинге {url}: {e}")
+        return None, None
+
+    if not img_url:
+        logger.warning(f"Не найдено изображение для: {original_name}")
+        return product_data, None
+    return product_data, (sanitized_name, img_url)
+
+def main():
+    args = parser2.parse_args()
+    metrics.configure_logging(args.log_level)
+    try:
+        with metrics.profiled(args.profile):
+            run(args)
+    finally:
+        # Отчёт нужен и после сбоя или Ctrl-C
+        metrics.write_report()
+
+def run(args):
+    """Обходит сайты из профилей одновременно
+
+    Пулы страниц и изображений, соединения, кэш и ограничение нагрузки на
+    каждый хост (http_client) общие для всех сайтов; у каждого сайта свои
+    CSV, папка изображений и порядок строк.
+    """
+    page_parser.BACKEND = args.backend
+    parser2.EXPORT_PARQUET = args.parquet
+    http_client.set_pool_size(MAX_WORKERS + IMAGE_WORKERS)
+    profiles = parser2.profiles_from_args(args, OUTPUT_FOLDER)
+
+    image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
+    page_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    site_executor = ThreadPoolExecutor(max_workers=len(profiles))
+    try:
+        futures = [site_executor.submit(crawl, profile, page_executor, image_executor, args.resume)
+                   for profile in profiles]
+        for future in futures:
+            future.result()
+    finally:
+        # При прерывании не ждём оставшиеся страницы: их обработает --resume.
+        # Отменённые задачи завершают и обходы остальных сайтов
+        page_executor.shutdown(cancel_futures=True)
+        image_executor.shutdown(cancel_futures=True)
+        site_executor.shutdown()
+        image_downloader.save_index()
+        brand_cache.save()
+
+    if image_processing.ENABLED:
+        for profile in profiles:
+            image_processing.process_folder(profile.output_folder)
+    http_client.print_stats()
+
+def crawl(profile, page_executor, image_executor, resume=False):
+    """Собирает товары одного сайта с изображениями в profile.csv_file"""
+    parser_photo_final.create_folder(profile.output_folder)
+
+    logger.info(f"Сбор ссылок на все товары ({profile.name})...")
+    incomplete = []
+    products = catalog_discovery.discover_in_background(profile.catalog_urls, profile.sitemap_url, profile,
+                                                        incomplete)
+    first = next(products, None)
+    if first is None:
+        logger.warning(f"Не удалось найти товары в каталоге ({profile.name})")
+        return
+
+    logger.info(f"\nНачало парсинга товаров ({profile.name})...")
+    output = parser2.CsvCheckpointWriter(profile.csv_file, resume=resume)
+    # Обработанные товары пропускаются, но их имена изображений остаются за ними
+    parser_photo_final.reserve_filenames(profile.output_folder, output.row_images())
+    pending = (item for item in itertools.chain([first], products) if item[0] not in output.done_urls)
+    processed = 0
+    downloaded = 0
+    completed = False
+    # Товары, ожидающие скачивания изображения, в порядке обнаружения
+    downloads = deque()
+
+    def process(item):
+        url, category = item
+        return process_product(url, category, profile)
+
+    def write(url, product_data, image_future):
+        nonlocal processed, downloaded
+        processed += 1
+        logger.debug(f"Обработка товара {processed}...")
+        image_filename = image_future.result() if image_future else None
+        if product_data and image_filename:
+            product_data.image = image_filename
+            downloaded += 1
+        output.write(url, product_data)
+
+    try:
+        # Имена файлов выдаются, а результаты записываются в порядке обнаружения
+        # товаров, чтобы имена изображений и порядок строк CSV не менялись.
+        # Изображения скачиваются, пока принимаются следующие страницы
+        for (url, category), (product_data, image) in parser2.iter_ordered(
+                page_executor, process, pending, parser2.WINDOW):
+            image_future = None
+            if image:
+                sanitized_name, img_url = image
+                filename = parser_photo_final.allocate_filename(
+                    profile.output_folder, sanitized_name, url, product_data.article)
+                image_future = image_executor.submit(image_downloader.download_image, img_url, filename,
+                                                     profile.output_folder, profile.headers)
+            downloads.append((url, product_data, image_future))
+            while downloads and (len(downloads) > parser2.WINDOW or downloads[0][2] is None
+                                 or downloads[0][2].done()):
+                write(*downloads.popleft())
+        while downloads:
+            write(*downloads.popleft())
+        completed = True
+    finally:
+        output.close(completed)
+
+    logger.info(f"\nСкачано изображений ({profile.name}): {downloaded}/{processed}")
+    logger.info(f"Данные успешно сохранены в {profile.csv_file}")
+    change_tracker.save_run(profile.csv_file, output.row_urls, output.failed_urls, incomplete)
+    change_tracker.export_delta(profile.csv_file)
+    parser2.export_parquet(profile.csv_file)
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,109 @@
+import hashlib
+import itertools
+import logging
 import os
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+import queue
+from urllib.parse import urljoin, urlsplit
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import http_client
+import image_downloader
+import image_processing
+import metrics
+import change_tracker
+import catalog_discovery
+import page_parser
+import parser2
 
 # Настройки
-BASE_URL = "https://visterma.ru"
-CATALOG_URL = "https://visterma.ru/catalog/prochee-Weishaupt/?SHOWALL_1=1"
+BASE_URL = parser2.BASE_URL
 OUTPUT_FOLDER = "Фото категория N"
-CSV_FILE = "visterma_products.csv"
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7"
-}
+# CSV, созданный parser2.py; с --site у каждого сайта свой CSV из профиля
+CSV_FILE = parser2.CSV_FILE
 MAX_WORKERS = 10
+# Отдельные потоки для скачивания изображений
+IMAGE_WORKERS = 10
+
+# Не чаще скольких секунд сохранять CSV с вписанными изображениями: файл
+# переписывается целиком, поэтому сохранение по числу изображений на большом
+# каталоге переписывало бы его сотни раз
+FLUSH_INTERVAL = 60
 
-# Словарь для хранения соответствия товаров и их изображений
-product_images = {}
+logger = logging.getLogger(__name__)
 
 def create_folder(folder_name):
     """Создаёт папку для сохранения изображений"""
     if not os.path.exists(folder_name):
         os.makedirs(folder_name)
-        print(f"Создана папка: {folder_name}")
+        logger.info(f"Создана папка: {folder_name}")
+
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+# Таблица для str.translate: строчные и заглавные буквы кириллицы -> латиница
+TRANSLIT_TABLE = str.maketrans({**_TRANSLIT, **{char.upper(): latin for char, latin in _TRANSLIT.items()}})
+# Для имени файла недопустимые символы удаляются той же таблицей
+FILENAME_TABLE = str.maketrans({**TRANSLIT_TABLE, **dict.fromkeys(map(ord, '\\/*?:"<>|'))})
+# Пробелы, запятые и подчёркивания в любом сочетании заменяются одним подчёркиванием
+_separators = re.compile(r'[\s,_]+')
+
+# Занятые имена файлов: (папка, имя) -> URL товара
+_allocated_names = {}
+_allocated_names_lock = threading.Lock()
 
 def transliterate_to_latin(text):
     """Транслитерирует русский текст в латиницу и преобразует в нижний регистр"""
-    translit_dict = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
-        'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
-        'А': 'a', 'Б': 'b', 'В': 'v', 'Г': 'g', 'Д': 'd', 'Е': 'e', 'Ё': 'e',
-        'Ж': 'zh', 'З': 'z', 'И': 'i', 'Й': 'y', 'К': 'k', 'Л': 'l', 'М': 'm',
-        'Н': 'n', 'О': 'o', 'П': 'p', 'Р': 'r', 'С': 's', 'Т': 't', 'У': 'u',
-        'Ф': 'f', 'Х': 'h', 'Ц': 'ts', 'Ч': 'ch', 'Ш': 'sh', 'Щ': 'sch',
-        'Ъ': '', 'Ы': 'y', 'Ь': '', 'Э': 'e', 'Ю': 'yu', 'Я': 'ya'
-    }
-    
-    result = []
-    for char in text:
-        if char in translit_dict:
-            result.append(translit_dict[char])
-        else:
-            result.append(char)
-    
-    return ''.join(result)
+    return text.translate(TRANSLIT_TABLE)
 
+@lru_cache(maxsize=4096)
 def sanitize_filename(filename):
     """Очищает название от недопустимых символов и преобразует в латиницу нижний регистр"""
-    latin_name = transliterate_to_latin(filename)
-    latin_name = re.sub(r'[\\/*?:"<>|]', "", latin_name)
-    latin_name = re.sub(r'[\s,]+', "_", latin_name)
-    latin_name = re.sub(r'_+', "_", latin_name)
-    latin_name = latin_name.lower()
-    latin_name = latin_name.strip('_')
-    return latin_name
-
-def get_all_product_links(catalog_url):
-    """Получает все ссылки на товары из каталога"""
-    try:
-        response = requests.get(catalog_url, headers=HEADERS)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-        product_links = []
-        
-        product_items = soup.select('.catalog-section .product-item-list-col-3 .row .c-4 .product-item-container .psk064')
-        
-        for item in product_items:
-            link = item.find('a', class_='psk024')
-            if link and link.get('href'):
-                full_url = urljoin(BASE_URL, link['href'])
-                product_links.append(full_url)
-        
-        print(f"Найдено {len(product_links)} товаров")
-        return product_links
-    except Exception as e:
-        print(f"Ошибка при получении ссылок на товары: {e}")
-        return []
+    return _separators.sub('_', filename.translate(FILENAME_TABLE)).lower().strip('_')
+
+def allocate_filename(folder, sanitized_name, url, article=''):
+    """Возвращает имя файла изображения товара url, не занятое другим товаром в папке folder
+
+    Первый товар получает sanitized_name, следующие товары с тем же именем -
+    имя с артикулом, а если и оно занято - с коротким хэшем URL. Повторный
+    вызов для того же товара возвращает то же имя. Вызывается в порядке
+    обнаружения товаров, а не по мере разбора страниц в потоках, иначе имена
+    менялись бы от запуска к запуску.
+    """
+    candidates = [sanitized_name]
+    if article:
+        candidates.append(f"{sanitized_name}_{sanitize_filename(article)}")
+    candidates.append(f"{sanitized_name}_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}")
+    with _allocated_names_lock:
+        for candidate in candidates:
+            if _allocated_names.setdefault((folder, candidate), url) == url:
+                if candidate != sanitized_name:
+                    logger.info(f"Имя файла {sanitized_name} уже занято другим товаром, используется {candidate}")
+                return candidate
+    # Совпал даже хэш URL - практически невозможно, но имя всё равно должно быть свободным
+    number = 2
+    with _allocated_names_lock:
+        while _allocated_names.setdefault((folder, f"{candidates[-1]}_{number}"), url) != url:
+            number += 1
+    return f"{candidates[-1]}_{number}"
+
+def reserve_filenames(folder, row_images):
+    """Закрепляет имена изображений товаров, записанных до прерывания (см. --resume)
+
+    row_images - пары (URL товара, имя файла с расширением), например из
+    parser2.CsvCheckpointWriter.row_images.
+    """
+    with _allocated_names_lock:
+        for url, image in row_images:
+            if image:
+                _allocated_names.setdefault((folder, os.path.splitext(image)[0]), url)
 
 def transform_image_url(original_url):
     """Преобразует URL изображения, убирая resize_cache и размеры"""
@@ -89,10 +112,12 @@ def transform_image_url(original_url):
     
     if 'resize_cache' in original_url:
         parts = original_url.split('/')
+        # Оригинал лежит на том же сайте, что и уменьшенная копия
+        site = urlsplit(original_url)
         try:
             medialibrary_index = parts.index('medialibrary')
             new_parts = [
-                BASE_URL,
+                f"{site.scheme}://{site.netloc}",
                 'upload',
                 'medialibrary',
                 parts[medialibrary_index + 1],
@@ -100,7 +125,7 @@ def transform_image_url(original_url):
             ]
             return '/'.join(new_parts)
         except (ValueError, IndexError):
-            print(f"Не удалось преобразовать URL: {original_url}")
+            logger.warning(f"Не удалось преобразовать URL: {original_url}")
             return original_url
     
     return original_url
@@ -115,137 +140,261 @@ def extract_image_url_from_style(style_content):
         return url_match.group(1)
     return None
 
-def get_product_name_and_image(url):
-    """Получает название товара и основное изображение с его страницы"""
+def get_image_url(page, page_url=None):
+    """Находит основное изображение товара на разобранной странице page_url"""
+    page_url = page_url or BASE_URL
+    src, style = page.image_attributes()
+    img_url = None
+    
+    if src:
+        original_img_url = urljoin(page_url, src)
+        img_url = transform_image_url(original_img_url)
+    
+    if not img_url and style:
+        style_url = extract_image_url_from_style(style)
+        if style_url:
+            original_img_url = urljoin(page_url, style_url)
+            img_url = transform_image_url(original_img_url)
+    
+    return img_url
+
+def get_name_and_image(page, url):
+    """Возвращает имя файла, URL изображения и название товара из разобранной страницы"""
+    original_name = page.title()
+    if original_name is None:
+        original_name = url.split('/')[-2]
+    sanitized_name = sanitize_filename(original_name)
+    return sanitized_name, get_image_url(page, url), original_name
+
+def get_product_name_and_image(url, profile=None):
+    """Получает имя файла, изображение, название и артикул товара с его страницы"""
     try:
-        response = requests.get(url, headers=HEADERS)
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        name_element = soup.find('h1')
-        original_name = name_element.get_text(strip=True) if name_element else url.split('/')[-2]
-        
-        sanitized_name = sanitize_filename(original_name)
-        
-        img_container = soup.select_one('div.product-item-detail-slider-image.active')
-        img_url = None
-        
-        if img_container:
-            img_tag = img_container.find('img')
-            if img_tag and img_tag.get('src'):
-                original_img_url = urljoin(BASE_URL, img_tag['src'])
-                img_url = transform_image_url(original_img_url)
-            
-            if not img_url and img_tag and img_tag.get('style'):
-                style_url = extract_image_url_from_style(img_tag['style'])
-                if style_url:
-                    original_img_url = urljoin(BASE_URL, style_url)
-                    img_url = transform_image_url(original_img_url)
-        
-        return sanitized_name, img_url, original_name
+        page = parser2.fetch_product_page(url, profile)
+        article = page.characteristics().get('Артикул', '')
+        return get_name_and_image(page, url) + (article,)
     except Exception as e:
-        print(f"Ошибка при обработке {url}: {e}")
+        logger.error(f"Ошибка при обработке {url}: {e}")
         original_name = url.split('/')[-2]
         sanitized_name = sanitize_filename(original_name)
-        return sanitized_name, None, original_name
+        return sanitized_name, None, original_name, ''
 
-def download_image(url, filename, folder):
-    """Скачивает и сохраняет изображение"""
-    try:
-        response = requests.get(url, headers=HEADERS, stream=True)
-        if response.status_code == 200:
-            ext = os.path.splitext(url.split('?')[0])[1]
-            if not ext:
-                content_type = response.headers.get('content-type', '')
-                if 'jpeg' in content_type or 'jpg' in content_type:
-                    ext = '.jpg'
-                elif 'png' in content_type:
-                    ext = '.png'
-                elif 'gif' in content_type:
-                    ext = '.gif'
-                elif 'webp' in content_type:
-                    ext = '.webp'
-                else:
-                    ext = '.jpg'
-            
-            full_filename = f"{filename}{ext}"
-            path = os.path.join(folder, full_filename)
-            with open(path, 'wb') as f:
-                for chunk in response.iter_content(1024):
-                    f.write(chunk)
-            return full_filename
-    except Exception as e:
-        print(f"Ошибка скачивания {url}: {e}")
-    return None
+def process_product(product_url, profile=None):
+    """Обрабатывает страницу товара сайта profile (по умолчанию visterma.ru)
 
-def process_product(product_url):
-    """Обрабатывает один товар"""
-    sanitized_name, img_url, original_name = get_product_name_and_image(product_url)
+    Возвращает пару (результат, (название для имени файла, URL изображения)).
+    Если изображение не найдено, вместо пары None, а результат уже окончательный.
+    """
+    sanitized_name, img_url, original_name, article = get_product_name_and_image(product_url, profile)
+    result = image_result(product_url, article, original_name)
     if img_url:
-        print(f"Обработка: {original_name}")
-        
-        image_filename = download_image(img_url, sanitized_name, OUTPUT_FOLDER)
-        if image_filename:
-            print(f"Скачано: {image_filename}")
-            # Сохраняем в словарь для последующего обновления CSV
-            product_images[original_name] = image_filename
-            return True
-        else:
-            print(f"Ошибка скачивания для: {original_name}")
+        logger.debug(f"Обработка: {original_name}")
+        return result, (sanitized_name, img_url)
+    logger.warning(f"Не найдено изображение для: {original_name}")
+    result['error'] = "изображение не найдено"
+    return result, None
+
+def image_result(url, article, original_name):
+    """Результат обработки изображения одного товара"""
+    return {
+        'url': url,
+        'article': article,
+        'original_name': original_name,
+        'file': None,
+        'bytes': 0,
+        'seconds': 0.0,
+        'error': None,
+    }
+
+def save_product_image(result, img_url, sanitized_name, folder=None, headers=None):
+    """Скачивает изображение товара в folder (по умолчанию OUTPUT_FOLDER) и дополняет его результат"""
+    folder = folder or OUTPUT_FOLDER
+    started = time.perf_counter()
+    image_filename = image_downloader.download_image(img_url, sanitized_name, folder, headers)
+    result['seconds'] = time.perf_counter() - started
+    if image_filename:
+        logger.debug(f"Скачано: {image_filename}")
+        result['file'] = image_filename
+        result['bytes'] = os.path.getsize(os.path.join(folder, image_filename))
     else:
-        print(f"Не найдено изображение для: {original_name}")
-    return False
+        logger.error(f"Ошибка скачивания для: {result['original_name']}")
+        result['error'] = "ошибка скачивания"
+    return result
+
+def write_csv_atomic(df, filename):
+    """Записывает CSV во временный файл и подменяет им filename
+
+    Кодировка и переводы строк те же, что у parser2, чтобы файл не менялся
+    там, где не менялись данные.
+    """
+    temp_filename = f"{filename}.tmp"
+    with metrics.stage('csv_write'):
+        df.to_csv(temp_filename, index=False, encoding='utf-8-sig', lineterminator='\r\n')
+        os.replace(temp_filename, filename)
+
+class CsvImageUpdater:
+    """Вписывает имена изображений в CSV по мере скачивания
+
+    CSV сохраняется не чаще раза в FLUSH_INTERVAL секунд и в конце (flush).
+
+    Товар сопоставляется со строкой CSV по артикулу, а при его отсутствии -
+    по названию. Если с одним ключом несколько товаров, n-й по порядку
+    обнаружения товар получает n-ю строку с этим ключом: parser2.py пишет
+    строки в том же порядке, поэтому товары с одинаковыми названиями больше
+    не затирают изображения друг друга.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Читаем все значения как строки, чтобы при записи они не изменились
+        self.df = pd.read_csv(filename, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        self.rows = {}
+        for row, (article, name) in enumerate(zip(self.df['Артикул'], self.df['Имя'])):
+            self.rows.setdefault(self._key(article, name), []).append(row)
+        self.seen = {}
+        self.pending = 0
+        self.flushed = time.monotonic()
+        self.updated = 0
+        self.unmatched = []
+        for (kind, value), rows in self.rows.items():
+            if kind == 'article' and len(rows) > 1:
+                logger.warning(f"Артикул встречается в CSV несколько раз: {value}")
+
+    @staticmethod
+    def _key(article, name):
+        return ('article', article) if article else ('name', name)
 
-def update_csv_final():
-    """Обновляет CSV файл один раз после скачивания всех изображений"""
+    def claim_row(self, result):
+        """Закрепляет за товаром строку CSV; вызывается в порядке обнаружения товаров"""
+        key = self._key(result['article'], result['original_name'])
+        occurrence = self.seen.get(key, 0)
+        self.seen[key] = occurrence + 1
+        rows = self.rows.get(key, [])
+        result['row'] = rows[occurrence] if occurrence < len(rows) else None
+
+    def apply(self, result):
+        """Вписывает изображение из результата; CSV сохраняется раз в FLUSH_INTERVAL секунд"""
+        if not result['file']:
+            return
+        if result['row'] is None:
+            self.unmatched.append(result['article'] or result['original_name'])
+            logger.warning(f"Не найден в CSV: {self.unmatched[-1]}")
+            return
+        self.df.iat[result['row'], self.df.columns.get_loc('Изображения')] = result['file']
+        self.updated += 1
+        self.pending += 1
+        if time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            write_csv_atomic(self.df, self.filename)
+            self.pending = 0
+        self.flushed = time.monotonic()
+
+def open_csv_updater(filename):
     try:
-        if not product_images:
-            print("Нет данных для обновления CSV")
-            return False
-        
-        # Читаем CSV
-        df = pd.read_csv(CSV_FILE)
-        
-        # Обновляем изображения
-        updated_count = 0
-        for product_name, image_filename in product_images.items():
-            mask = df['Имя'] == product_name
-            if mask.any():
-                df.loc[mask, 'Изображения'] = image_filename
-                updated_count += 1
-                print(f"Обновлено: {product_name} -> {image_filename}")
-            else:
-                print(f"Не найден в CSV: {product_name}")
-        
-        # Сохраняем обратно
-        df.to_csv(CSV_FILE, index=False, encoding='utf-8')
-        print(f"CSV обновлен. Обновлено записей: {updated_count}/{len(product_images)}")
-        return True
-        
+        return CsvImageUpdater(filename)
     except Exception as e:
-        print(f"Ошибка при обновлении CSV: {e}")
-        return False
+        logger.error(f"Ошибка при чтении CSV, изображения будут только скачаны: {e}")
+        return None
 
 def main():
-    create_folder(OUTPUT_FOLDER)
-    product_urls = get_all_product_links(CATALOG_URL)
+    # Аргументы те же, что у parser2.py, чтобы оба шага обходили одни и те же
+    # сайты и разделы; --resume не нужен: уже скачанные изображения не
+    # скачиваются заново и так
+    args = parser2.parse_args()
+    metrics.configure_logging(args.log_level)
+    try:
+        with metrics.profiled(args.profile):
+            run(args)
+    finally:
+        # Отчёт нужен и после сбоя или Ctrl-C
+        metrics.write_report()
+
+def run(args):
+    page_parser.BACKEND = args.backend
+    parser2.EXPORT_PARQUET = args.parquet
+    http_client.set_pool_size(MAX_WORKERS + IMAGE_WORKERS)
+    profiles = parser2.profiles_from_args(args, OUTPUT_FOLDER)
+    for profile in profiles:
+        update_images(profile)
+    if image_processing.ENABLED:
+        for profile in profiles:
+            image_processing.process_folder(profile.output_folder)
+    http_client.print_stats()
+
+def update_images(profile):
+    """Скачивает изображения товаров одного сайта и вписывает их в profile.csv_file"""
+    create_folder(profile.output_folder)
+    products = catalog_discovery.discover_in_background(profile.catalog_urls, profile.sitemap_url, profile)
+    first = next(products, None)
     
-    if not product_urls:
-        print("Не удалось найти товары в каталоге")
+    if first is None:
+        logger.warning(f"Не удалось найти товары в каталоге ({profile.name})")
         return
     
-    # Обрабатываем товары
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(process_product, url) for url in product_urls]
-        
-        success = 0
-        for future in as_completed(futures):
-            if future.result():
-                success += 1
+    updater = open_csv_updater(profile.csv_file)
+    found = success = downloaded_bytes = 0
+    # Скачанные изображения: future попадает сюда, как только завершится
+    finished = queue.SimpleQueue()
+    downloads = 0
+    
+    def collect(result):
+        nonlocal success, downloaded_bytes
+        if result['file']:
+            success += 1
+            downloaded_bytes += result['bytes']
+        if updater:
+            updater.apply(result)
+    
+    try:
+        # Страницы и изображения обрабатываются в разных пулах, чтобы большие
+        # изображения не занимали потоки, которые нужны для страниц. Результаты
+        # собирает только этот поток, поэтому общего изменяемого состояния нет
+        with ThreadPoolExecutor(max_workers=IMAGE_WORKERS) as image_executor, \
+                ThreadPoolExecutor(max_workers=MAX_WORKERS) as page_executor:
+            # Страницы принимаются в порядке обнаружения, чтобы строки CSV и имена
+            # файлов закреплялись за товарами однозначно, а готовые изображения
+            # вписываются в CSV между ними, не дожидаясь остальных. В работе не
+            # больше WINDOW страниц и WINDOW изображений
+            urls = (url for url, _ in itertools.chain([first], products))
+            for url, (result, image) in parser2.iter_ordered(
+                    page_executor, lambda url: process_product(url, profile), urls, parser2.WINDOW):
+                found += 1
+                if updater:
+                    updater.claim_row(result)
+                if image is None:
+                    collect(result)
+                else:
+                    sanitized_name, img_url = image
+                    filename = allocate_filename(profile.output_folder, sanitized_name, url, result['article'])
+                    future = image_executor.submit(save_product_image, result, img_url, filename,
+                                                   profile.output_folder, profile.headers)
+                    future.add_done_callback(finished.put)
+                    downloads += 1
+                while downloads and (downloads >= parser2.WINDOW or not finished.empty()):
+                    collect(finished.get().result())
+                    downloads -= 1
+            while downloads:
+                collect(finished.get().result())
+                downloads -= 1
+    finally:
+        # Вписанные изображения сохраняются и при прерывании
+        if updater:
+            updater.flush()
+        image_downloader.save_index()
     
-    print(f"\nСкачано изображений: {success}/{len(product_urls)}")
+    logger.info(f"\nСкачано изображений ({profile.name}): {success}/{found}, "
+                f"{downloaded_bytes / 1024 / 1024:.1f} МБ")
     
-    # ОДИН РАЗ обновляем CSV
-    update_csv_final()
+    if updater:
+        logger.info(f"CSV обновлен. Обновлено записей: {updater.updated}/{success}, "
+                    f"не найдено: {len(updater.unmatched)}")
+        if updater.updated:
+            # Отпечатки считаются по CSV уже с изображениями, поэтому после
+            # parser2.py изменения выгружает этот шаг, а не parser2.py
+            change_tracker.export_delta(profile.csv_file)
+        parser2.export_parquet(profile.csv_file)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
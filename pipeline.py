@@ -0,0 +1,310 @@
+"""Сбор товаров с изображениями конвейером на asyncio
+
+    поиск товаров -> [ссылки] -> загрузка страниц -> [страницы] -> разбор в пуле процессов
+    разбор -> выбор имён файлов (по порядку) -> [изображения] -> скачивание изображений
+    выбор имён и скачивание -> запись CSV (одна задача, по порядку)
+
+Этапы связаны очередями ограниченного размера, а товаров в работе не больше
+WINDOW: если какой-то этап не успевает, предыдущие ждут его, поэтому память
+не растёт с размером каталога. BeautifulSoup и очистка описаний работают в
+отдельных процессах и не отнимают время у загрузок. Страницы и изображения
+загружаются через http_client в общем пуле из FETCHERS + IMAGE_WORKERS
+потоков, по размеру пула соединений, сколько бы ни было сайтов. Это
+сознательно: кэш, повторы и ограничение нагрузки на сайт живут в синхронном
+http_client и одинаковы у всех скриптов, а asyncio здесь только связывает
+этапы. Ожидание поиска товаров занимает отдельный поток на сайт. CSV пишет
+одна задача в порядке обнаружения товаров: результат совпадает с
+parser_full.py, а прерванный запуск продолжается с --resume.
+
+Одна команда вместо parser2.py и parser_photo_final.py, с теми же
+параметрами, что у parser2.py (в том числе --site для нескольких сайтов):
+    python pipeline.py [--resume] [--site профиль.json ...] [--parquet]
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import brand_cache
+import catalog_discovery
+import change_tracker
+import http_client
+import image_downloader
+import image_processing
+import metrics
+import page_parser
+import parser2
+import parser_photo_final
+
+OUTPUT_FOLDER = parser_photo_final.OUTPUT_FOLDER
+# Одновременные загрузки страниц и изображений
+FETCHERS = 10
+IMAGE_WORKERS = 10
+# Процессы разбора страниц; None - по числу ядер
+PARSE_PROCESSES = None
+# Размер очередей между этапами
+QUEUE_SIZE = 50
+# Сколько товаров одного сайта может одновременно находиться в работе и ждать записи
+WINDOW = 200
+
+logger = logging.getLogger(__name__)
+
+# Скомпилированные селекторы в процессе разбора: словарь селекторов -> Selectors
+_selectors = {}
+
+def fetch_page(url, headers=None):
+    """Загружает страницу товара; выполняется в потоке"""
+    with metrics.stage('page_fetch'):
+        response = http_client.fetch(url, headers=headers)
+    # Учитываются только байты, пришедшие по сети, а не из кэша
+    if not getattr(response, 'from_cache', False):
+        metrics.add_bytes('page_fetch', len(response.content))
+    return response.text
+
+def parse_in_process(url, html, category, backend, css):
+    """Разбирает страницу товара; выполняется в процессе пула
+
+    Возвращает товар, (имя файла, URL изображения, название), информацию о
+    производителях, впервые очищенную в этом процессе, замеры этапов
+    (разбор и очистка описания) и текст ошибки или None. Замеры и ошибка
+    возвращаются и при неудачном разборе, чтобы попасть в отчёт о запуске.
+    """
+    product = image = error = None
+    try:
+        with metrics.stage('parse'):
+            key = tuple(sorted(css.items()))
+            if key not in _selectors:
+                _selectors[key] = page_parser.Selectors(css)
+            page = page_parser.parse_page(html, backend, _selectors[key])
+            product = parser2.parse_product_document(page, category)
+            image = parser_photo_final.get_name_and_image(page, url)
+    except Exception as e:
+        error = str(e)
+    return product, image, brand_cache.get_cache().take_updates(), metrics.take_stages(), error
+
+class Pipeline:
+    """Конвейер обхода одного сайта
+
+    Каждый товар получает future, который этапы разбора заполняют парой
+    (товар или None, (название для имени файла, URL изображения) или None).
+    Имена файлов выдаются, а товары записываются в порядке обнаружения
+    товаров, поэтому имена изображений не зависят от того, какая страница
+    разобрана раньше.
+    """
+
+    def __init__(self, profile, parse_pool, parsers, io_pool, discovery_pool, resume=False):
+        self.profile = profile
+        self.parse_pool = parse_pool
+        # Задач разбора больше, чем процессов, чтобы процессы не простаивали между страницами
+        self.parsers = parsers
+        self.io_pool = io_pool
+        self.discovery_pool = discovery_pool
+        self.resume = resume
+        self.links = asyncio.Queue(QUEUE_SIZE)
+        self.pages = asyncio.Queue(QUEUE_SIZE)
+        self.images = asyncio.Queue(QUEUE_SIZE)
+        self.order = asyncio.Queue()
+        self.ready = asyncio.Queue()
+        self.window = asyncio.Semaphore(WINDOW)
+        self.output = None
+        self.processed = 0
+        self.downloaded = 0
+
+    def _in_thread(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.io_pool, func, *args)
+
+    def _next_product(self, products):
+        """Ждёт следующий найденный товар в своём потоке, не занимая потоки загрузок"""
+        return asyncio.get_running_loop().run_in_executor(self.discovery_pool, next, products, None)
+
+    async def run(self):
+        profile = self.profile
+        parser_photo_final.create_folder(profile.output_folder)
+        logger.info(f"Сбор товаров ({profile.name})...")
+        incomplete = []
+        products = catalog_discovery.discover_in_background(profile.catalog_urls, profile.sitemap_url, profile,
+                                                            incomplete)
+        first = await self._next_product(products)
+        if first is None:
+            logger.warning(f"Не удалось найти товары в каталоге ({profile.name})")
+            return
+        # CSV открывается только после первого найденного товара, чтобы пустой
+        # или недоступный каталог не стирал результаты прошлого запуска
+        self.output = parser2.CsvCheckpointWriter(profile.csv_file, resume=self.resume)
+        # Обработанные товары пропускаются, но их имена изображений остаются за ними
+        parser_photo_final.reserve_filenames(profile.output_folder, self.output.row_images())
+        tasks = [asyncio.ensure_future(stage) for stage in
+                 (self._discover(itertools.chain([first], products)), self._fetch_stage(), self._parse_stage(),
+                  self._allocate(), self._image_stage(), self._write())]
+        completed = False
+        try:
+            await asyncio.gather(*tasks)
+            completed = True
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Дожидаемся отменённых этапов, чтобы ни один не писал после закрытия CSV
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.output.close(completed)
+
+        logger.info(f"\nСкачано изображений ({profile.name}): {self.downloaded}/{self.processed}")
+        logger.info(f"Данные успешно сохранены в {profile.csv_file}")
+        change_tracker.save_run(profile.csv_file, self.output.row_urls, self.output.failed_urls, incomplete)
+        change_tracker.export_delta(profile.csv_file)
+        parser2.export_parquet(profile.csv_file)
+
+    async def _discover(self, products):
+        """Ставит необработанные товары в очередь, пока в работе меньше WINDOW товаров"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._next_product(products)
+            if item is None:
+                break
+            url, category = item
+            if url in self.output.done_urls:
+                continue
+            await self.window.acquire()
+            result = loop.create_future()
+            await self.order.put((url, result))
+            await self.links.put((url, category, result))
+        await self.order.put(None)
+        for _ in range(FETCHERS):
+            await self.links.put(None)
+
+    async def _fetch_stage(self):
+        await asyncio.gather(*(self._fetcher() for _ in range(FETCHERS)))
+        for _ in range(self.parsers):
+            await self.pages.put(None)
+
+    async def _fetcher(self):
+        while (item := await self.links.get()) is not None:
+            url, category, result = item
+            try:
+                html = await self._in_thread(fetch_page, url, self.profile.headers)
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке {url}: {e}")
+                result.set_result((None, None))
+                continue
+            await self.pages.put((url, category, html, result))
+
+    async def _parse_stage(self):
+        await asyncio.gather(*(self._parser() for _ in range(self.parsers)))
+
+    async def _parser(self):
+        loop = asyncio.get_running_loop()
+        while (item := await self.pages.get()) is not None:
+            url, category, html, result = item
+            try:
+                product, image, brands, stages, error = await loop.run_in_executor(
+                    self.parse_pool, parse_in_process, url, html, category,
+                    page_parser.BACKEND, self.profile.selectors.css)
+            except Exception as e:
+                error = str(e)
+            else:
+                metrics.merge_stages(stages)
+                if brands:
+                    brand_cache.get_cache().update(brands)
+            if error is not None:
+                logger.error(f"Ошибка при парсинге {url}: {error}")
+                result.set_result((None, None))
+                continue
+            sanitized_name, img_url, original_name = image
+            if not img_url:
+                logger.warning(f"Не найдено изображение для: {original_name}")
+                result.set_result((product, None))
+                continue
+            result.set_result((product, (sanitized_name, img_url)))
+
+    async def _allocate(self):
+        """Выдаёт имена файлов в порядке обнаружения и ставит изображения в очередь на скачивание"""
+        loop = asyncio.get_running_loop()
+        while (item := await self.order.get()) is not None:
+            url, result = item
+            product, image = await result
+            download = None
+            if image:
+                sanitized_name, img_url = image
+                filename = parser_photo_final.allocate_filename(
+                    self.profile.output_folder, sanitized_name, url, product.article)
+                download = loop.create_future()
+                await self.images.put((img_url, filename, download))
+            await self.ready.put((url, product, download))
+        await self.ready.put(None)
+        for _ in range(IMAGE_WORKERS):
+            await self.images.put(None)
+
+    async def _image_stage(self):
+        await asyncio.gather(*(self._image_worker() for _ in range(IMAGE_WORKERS)))
+
+    async def _image_worker(self):
+        while (item := await self.images.get()) is not None:
+            img_url, filename, image = item
+            try:
+                image.set_result(await self._in_thread(
+                    image_downloader.download_image, img_url, filename, self.profile.output_folder,
+                    self.profile.headers))
+            except Exception as e:
+                logger.error(f"Ошибка скачивания {img_url}: {e}")
+                image.set_result(None)
+
+    async def _write(self):
+        """Записывает товары в порядке обнаружения, чтобы порядок строк CSV не менялся"""
+        while (item := await self.ready.get()) is not None:
+            url, product, download = item
+            image_filename = await download if download is not None else None
+            self.processed += 1
+            logger.debug(f"Обработка товара {self.processed}...")
+            if product and image_filename:
+                product.image = image_filename
+                self.downloaded += 1
+            self.output.write(url, product)
+            self.window.release()
+
+async def run_pipelines(profiles, resume=False):
+    """Обходит сайты одновременно с общими пулами процессов и потоков"""
+    # Загрузки страниц и изображений всех сайтов делят один пул размером с пул
+    # соединений http_client; нагрузку на каждый хост и так ограничивает HostLimiter
+    io_pool = ThreadPoolExecutor(max_workers=FETCHERS + IMAGE_WORKERS)
+    discovery_pool = ThreadPoolExecutor(max_workers=len(profiles))
+    processes = PARSE_PROCESSES or os.cpu_count() or 1
+    # spawn: к запуску пула уже работают потоки, и копировать их блокировки через fork небезопасно
+    parse_pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        await asyncio.gather(*(Pipeline(profile, parse_pool, processes * 2, io_pool, discovery_pool,
+                                        resume).run()
+                               for profile in profiles))
+    finally:
+        parse_pool.shutdown(cancel_futures=True)
+        io_pool.shutdown(wait=False, cancel_futures=True)
+        discovery_pool.shutdown(wait=False, cancel_futures=True)
+
+def main():
+    args = parser2.parse_args()
+    metrics.configure_logging(args.log_level)
+    try:
+        with metrics.profiled(args.profile):
+            run(args)
+    finally:
+        # Отчёт нужен и после сбоя или Ctrl-C
+        metrics.write_report()
+
+def run(args):
+    page_parser.BACKEND = args.backend
+    parser2.EXPORT_PARQUET = args.parquet
+    http_client.set_pool_size(FETCHERS + IMAGE_WORKERS)
+    profiles = parser2.profiles_from_args(args, OUTPUT_FOLDER)
+    try:
+        asyncio.run(run_pipelines(profiles, args.resume))
+    finally:
+        image_downloader.save_index()
+        brand_cache.save()
+
+    if image_processing.ENABLED:
+        for profile in profiles:
+            image_processing.process_folder(profile.output_folder)
+    http_client.print_stats()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Профили сайтов: откуда брать товары и как разбирать их страницы
+
+Профиль - файл JSON (или YAML, если установлен PyYAML), например
+profiles/visterma.json:
+    name           - имя профиля, используется в логах и именах файлов;
+    base_url       - адрес сайта;
+    catalog_urls   - разделы каталога, пути относительно base_url или полные адреса;
+    sitemap_url    - sitemap.xml с товарами (необязательно);
+    csv_file       - куда сохранять товары (по умолчанию <name>_products.csv);
+    output_folder  - папка для изображений (по умолчанию <name>_images);
+    headers        - дополнительные заголовки запросов страниц;
+    selectors      - CSS-селекторы, отличающиеся от page_parser.DEFAULT_SELECTORS.
+Селекторы компилируются один раз при загрузке профиля, неизвестные ключи и
+ошибки в селекторах обнаруживаются сразу, а не на середине обхода.
+"""
+import json
+import os
+from urllib.parse import urljoin
+
+import page_parser
+
+FIELDS = ('name', 'base_url', 'catalog_urls', 'sitemap_url', 'csv_file',
+          'output_folder', 'headers', 'selectors')
+
+class SiteProfile:
+    """Настройки обхода одного сайта"""
+
+    def __init__(self, name, base_url, catalog_urls, sitemap_url=None, csv_file=None,
+                 output_folder=None, headers=None, selectors=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.catalog_urls = [urljoin(self.base_url + '/', url) for url in catalog_urls]
+        self.sitemap_url = urljoin(self.base_url + '/', sitemap_url) if sitemap_url else None
+        self.csv_file = csv_file or f"{name}_products.csv"
+        self.output_folder = output_folder or f"{name}_images"
+        self.headers = headers or None
+        self.selectors = page_parser.Selectors(selectors)
+
+    @classmethod
+    def from_dict(cls, config):
+        unknown = set(config) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля профиля: {', '.join(sorted(unknown))}")
+        for field in ('name', 'base_url', 'catalog_urls'):
+            if not config.get(field):
+                raise ValueError(f"В профиле не задано поле {field}")
+        return cls(**config)
+
+    def __repr__(self):
+        return f"SiteProfile({self.name!r}, {self.base_url!r})"
+
+def load(path):
+    """Загружает профиль из JSON или YAML файла"""
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError(f"Для профиля {path} нужен PyYAML (pip install pyyaml) "
+                                   f"или профиль в формате JSON")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    try:
+        return SiteProfile.from_dict(config)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from e
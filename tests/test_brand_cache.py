@@ -0,0 +1,53 @@
+"""brand_cache: ключи производителей и передача информации из процессов разбора"""
+import json
+
+import brand_cache
+import page_parser
+
+def product_page(brand_html=None):
+    brand = f'<li id="brand">{brand_html}</li>' if brand_html else ''
+    return page_parser.parse_page(
+        f'<html><body><h1>Товар</h1><ul><li id="desc"><p>Описание</p></li>{brand}'
+        f'<li id="char"></li></ul></body></html>')
+
+def test_brand_is_refreshed_from_a_later_page(tmp_path):
+    cache = brand_cache.BrandCache(str(tmp_path / 'brands.json'))
+    characteristics = {'Производитель': 'Acme'}
+
+    # На первой странице производителя нет блока: ключ не считается обновлённым
+    assert cache.resolve(product_page(), characteristics) == 'Acme'
+    assert cache.get('Acme') == "Нет информации"
+
+    assert cache.resolve(product_page('<p>О компании Acme</p>'), characteristics) == 'Acme'
+    assert 'О компании Acme' in cache.get('Acme')
+
+    # Обновлённый блок больше не очищается
+    assert cache.resolve(product_page('<p>Другой текст</p>'), characteristics) == 'Acme'
+    assert 'О компании Acme' in cache.get('Acme')
+
+def test_brand_without_characteristic_is_keyed_by_block_hash(tmp_path):
+    cache = brand_cache.BrandCache(str(tmp_path / 'brands.json'))
+    key = cache.resolve(product_page('<p>Без названия</p>'), {})
+    assert key.startswith('#')
+    assert cache.resolve(product_page('<p>Без названия</p>'), {}) == key
+    assert cache.resolve(product_page(), {}) is None
+
+def test_updates_from_workers_are_merged_and_saved(tmp_path):
+    filename = str(tmp_path / 'brands.json')
+    main = brand_cache.BrandCache(filename)
+    # Каждый процесс разбора держит свой кэш и отдаёт изменения вместе с товаром
+    workers = [brand_cache.BrandCache(filename), brand_cache.BrandCache(filename)]
+    workers[0].resolve(product_page('<p>Acme</p>'), {'Производитель': 'Acme'})
+    workers[1].resolve(product_page('<p>Beta</p>'), {'Бренд': 'Beta'})
+    workers[1].resolve(product_page('<p>Acme</p>'), {'Производитель': 'Acme'})
+
+    for worker in workers:
+        main.update(worker.take_updates())
+        assert worker.take_updates() == {}
+    assert set(main.brands) == {'Acme', 'Beta'}
+
+    main.save()
+    with open(filename, encoding='utf-8') as f:
+        assert json.load(f) == main.brands
+    # Без новых изменений файл не переписывается
+    assert not main.changed
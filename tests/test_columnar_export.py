@@ -0,0 +1,41 @@
+"""columnar_export: CSV товаров и характеристик -> Parquet"""
+import pandas as pd
+import pytest
+
+import columnar_export
+import parser2
+
+pytest.importorskip('pyarrow')
+
+def test_products_and_characteristics_round_trip(tmp_path):
+    filename = str(tmp_path / "products.csv")
+    output = parser2.CsvCheckpointWriter(filename)
+    output.write('u1', parser2.Product(name="Котёл", article='A1',
+                                       characteristics={'Артикул': 'A1', 'Мощность': '24 кВт', 'Вес': '30 кг'}))
+    output.write('u2', parser2.Product(name="Насос", article='A2'))
+    output.close()
+
+    assert columnar_export.csv_to_parquet(filename) == 2
+    products = pd.read_parquet(columnar_export.parquet_filename(filename))
+    assert list(products['Артикул']) == ['A1', 'A2']
+    assert list(products['Базовая цена']) == [0.0, 0.0]
+    assert str(products['Опубликован'].dtype) == 'Int64'
+
+    characteristics_file = parser2.characteristics_filename(filename)
+    assert columnar_export.csv_to_parquet(characteristics_file) == 3
+    characteristics = pd.read_parquet(columnar_export.parquet_filename(characteristics_file))
+    assert list(characteristics.columns) == parser2.CHARACTERISTICS_FIELDNAMES
+    assert dict(zip(characteristics['Характеристика'], characteristics['Значение']))['Мощность'] == '24 кВт'
+
+def test_fractional_and_invalid_numbers(tmp_path, monkeypatch):
+    filename = tmp_path / "products.csv"
+    filename.write_text("ID,Наличие,Базовая цена\r\n1,1,12.5\r\n2.0,,\"12,5\"\r\n3,да,\r\n", encoding='utf-8-sig')
+    # Маленькие куски проверяют, что схема не зависит от значений в куске
+    monkeypatch.setattr(columnar_export, 'CHUNK_ROWS', 1)
+
+    assert columnar_export.csv_to_parquet(str(filename)) == 3
+    table = pd.read_parquet(columnar_export.parquet_filename(str(filename)))
+    assert list(table['ID']) == [1, 2, 3]
+    assert table['Наличие'].isna().tolist() == [False, True, True]
+    assert table['Базовая цена'].tolist()[:2] == [12.5, 12.5]
+    assert pd.isna(table['Базовая цена'][2])
@@ -0,0 +1,68 @@
+"""crawl_control.HostLimiter: AIMD-предел одновременных запросов на локальном сайте"""
+import time
+
+import pytest
+import requests
+
+import crawl_control
+import http_client
+import mock_site
+
+@pytest.fixture
+def site(monkeypatch):
+    monkeypatch.setattr(http_client, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(http_client, 'REQUESTS_PER_SECOND', 0)
+    monkeypatch.setattr(http_client, 'BACKOFF_MAX', 0.05)
+    monkeypatch.setattr(crawl_control, 'RESPECT_ROBOTS', False)
+    # Время ответа локального сервера скачет, рост предела проверяется только по 429
+    monkeypatch.setattr(crawl_control, 'LATENCY_FACTOR', 1000)
+    http_client.set_pool_size(8)
+    site = mock_site.MockSite(products=5)
+    server, base = mock_site.start(site)
+    yield site, base
+    server.shutdown()
+    http_client.set_pool_size(8)
+
+def test_limit_halves_on_429_and_grows_back(site, monkeypatch):
+    site, base = site
+    monkeypatch.setattr(http_client, 'MAX_RETRIES', 1)
+    url = f"{base}/catalog/kotly/mock-1/"
+    limiter = http_client.get_limiter(url)
+    initial = limiter.limit
+
+    site.throttle_rate = 1.0
+    started = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        http_client.fetch(url)
+    # Повторный 429 сразу после первого предел второй раз не снижает
+    assert limiter.limit == initial * crawl_control.DECREASE_FACTOR
+    assert limiter.decreases == 1
+    # Retry-After приостановил все запросы к хосту
+    assert limiter.paused_until > started
+
+    site.throttle_rate = 0.0
+    for _ in range(10):
+        http_client.fetch(url)
+    assert limiter.limit >= initial
+    assert limiter.in_flight == 0
+
+def test_stream_holds_slot_until_closed(site):
+    site, base = site
+    url = f"{base}/upload/medialibrary/mock/1.jpg"
+    limiter = http_client.get_limiter(url)
+
+    response = http_client.fetch(url, stream=True)
+    assert limiter.in_flight == 1
+    with response:
+        b''.join(response.iter_content(1024))
+    assert limiter.in_flight == 0
+    response.close()
+    assert limiter.in_flight == 0
+
+def test_decrease_is_rate_limited():
+    limiter = crawl_control.HostLimiter('example.com', max_concurrency=16)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(overloaded=True)
+    assert limiter.limit == crawl_control.INITIAL_CONCURRENCY * crawl_control.DECREASE_FACTOR
+    assert limiter.decreases == 1
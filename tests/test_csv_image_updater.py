@@ -0,0 +1,48 @@
+"""CsvImageUpdater: имена изображений в CSV от parser2.py"""
+import pandas as pd
+
+import parser2
+import parser_photo_final
+
+def write_csv(filename, products):
+    output = parser2.CsvCheckpointWriter(filename)
+    for i, (name, article) in enumerate(products):
+        output.write(f"https://example.com/{i}/", parser2.Product(
+            name=name, article=article, description='', short_description='', category='',
+            manufacturer=None, characteristics={}))
+    output.close()
+
+def result(url, article, name, file):
+    return dict(parser_photo_final.image_result(url, article, name), file=file)
+
+def images(filename):
+    return list(pd.read_csv(filename, dtype=str, keep_default_na=False, encoding='utf-8-sig')['Изображения'])
+
+def test_rows_are_claimed_in_discovery_order_and_saved_on_flush(tmp_path, monkeypatch):
+    filename = str(tmp_path / "products.csv")
+    write_csv(filename, [("Горелка", ""), ("Горелка", ""), ("Датчик", "D-1")])
+    monkeypatch.setattr(parser_photo_final, 'FLUSH_INTERVAL', 3600)
+    updater = parser_photo_final.CsvImageUpdater(filename)
+    results = [result('u0', '', "Горелка", 'gorelka.jpg'),
+               result('u1', '', "Горелка", 'gorelka_1a2b3c4d.jpg'),
+               result('u2', 'D-1', "Датчик", 'datchik.jpg')]
+    for item in results:
+        updater.claim_row(item)
+    # Изображения скачиваются в любом порядке
+    for item in reversed(results):
+        updater.apply(item)
+    assert images(filename) == ['', '', '']
+
+    updater.flush()
+    assert images(filename) == ['gorelka.jpg', 'gorelka_1a2b3c4d.jpg', 'datchik.jpg']
+    assert updater.updated == 3 and updater.unmatched == []
+
+def test_csv_is_saved_after_flush_interval(tmp_path, monkeypatch):
+    filename = str(tmp_path / "products.csv")
+    write_csv(filename, [("Горелка", "G-1")])
+    monkeypatch.setattr(parser_photo_final, 'FLUSH_INTERVAL', 0)
+    updater = parser_photo_final.CsvImageUpdater(filename)
+    item = result('u0', 'G-1', "Горелка", 'gorelka.jpg')
+    updater.claim_row(item)
+    updater.apply(item)
+    assert images(filename) == ['gorelka.jpg']
@@ -0,0 +1,26 @@
+"""CsvCheckpointWriter: журнал, продолжение после прерывания"""
+import parser2
+
+def product(article, **characteristics):
+    return parser2.Product(name=f"Товар {article}", article=article, description='<p>Описание</p>',
+                           short_description='Описание', category='Раздел', manufacturer=None,
+                           characteristics=characteristics)
+
+def test_resume_skips_written_and_retries_failed(tmp_path):
+    filename = str(tmp_path / "products.csv")
+    output = parser2.CsvCheckpointWriter(filename)
+    output.write('u1', product('A1'))
+    output.write('u2', None)
+    output.write('u3', product('A3'))
+    output.close(completed=False)
+
+    output = parser2.CsvCheckpointWriter(filename, resume=True)
+    assert output.done_urls == {'u1', 'u3'}
+    assert output.failed_urls == {'u2'}
+    output.write('u2', product('A2'))
+    assert output.row_urls == ['u1', 'u3', 'u2']
+    assert output.failed_urls == set()
+    output.close()
+
+    with open(filename, encoding='utf-8-sig') as f:
+        assert len(f.read().splitlines()) == 4
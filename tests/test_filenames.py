@@ -0,0 +1,113 @@
+"""Имена файлов изображений: sanitize_filename и allocate_filename
+
+sanitize_filename сравнивается с прежней посимвольной реализацией
+(benchmark._old_sanitize_filename), скорость замеряет benchmark.py --names.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import os
+
+import pytest
+
+import benchmark
+import crawl_control
+import http_client
+import mock_site
+import parser2
+import parser_full
+import parser_photo_final
+import site_profile
+from parser_photo_final import allocate_filename, sanitize_filename
+
+# Названия с совпадающей транслитерацией: «Датчик», «ДАТЧИК» и «Датчик,» дают одно имя
+PRODUCTS = [
+    ("Датчик пламени QRA", "ART-1"),
+    ("ДАТЧИК ПЛАМЕНИ QRA", "ART-2"),
+    ("Датчик  пламени, QRA", ""),
+    ("Датчик пламени QRA", "ART-1"),
+    ("Горелка", "G-1"),
+    ("горелка", "G 1"),
+    ("Горелка", ""),
+]
+
+@pytest.fixture(autouse=True)
+def allocated_names(monkeypatch):
+    """Каждый тест начинает с пустого списка занятых имён"""
+    monkeypatch.setattr(parser_photo_final, '_allocated_names', {})
+
+def allocate_all(folder, products):
+    return [allocate_filename(folder, sanitize_filename(name), f"https://example.com/product/{i}/", article)
+            for i, (name, article) in enumerate(products)]
+
+def test_cyrillic_block_matches_old_implementation():
+    for code in range(0x400, 0x530):
+        char = chr(code)
+        assert sanitize_filename(char) == benchmark._old_sanitize_filename(char), hex(code)
+        assert sanitize_filename(f" {char}{char.upper()}, ") == benchmark._old_sanitize_filename(f" {char}{char.upper()}, ")
+
+def test_random_names_match_old_implementation():
+    names = benchmark.sample_names([name for name, _ in PRODUCTS], count=5000)
+    mismatches = [name for name in names if sanitize_filename(name) != benchmark._old_sanitize_filename(name)]
+    assert mismatches == []
+
+def test_names_are_unique():
+    names = allocate_all('photos', PRODUCTS)
+    assert len(set(names)) == len(names)
+    assert names[0] == 'datchik_plameni_qra'
+    assert names[1] == 'datchik_plameni_qra_art-2'
+    # Без артикула - короткий хэш ссылки
+    assert names[2].startswith('datchik_plameni_qra_') and len(names[2]) == len('datchik_plameni_qra_') + 8
+    assert names[3] == 'datchik_plameni_qra_art-1'
+    assert names[4:6] == ['gorelka', 'gorelka_g_1']
+
+def test_same_product_gets_same_name():
+    url = "https://example.com/product/1/"
+    first = allocate_filename('photos', 'gorelka', url, 'G-1')
+    allocate_filename('photos', 'gorelka', "https://example.com/product/2/", 'G-2')
+    assert allocate_filename('photos', 'gorelka', url, 'G-1') == first == 'gorelka'
+
+def test_folders_are_independent():
+    assert allocate_all('photos', PRODUCTS) == allocate_all('other', PRODUCTS)
+
+def test_names_are_stable_between_runs():
+    """Тот же порядок обнаружения в новом запуске даёт те же имена"""
+    expected = allocate_all('photos', PRODUCTS)
+    parser_photo_final._allocated_names.clear()
+    assert allocate_all('photos', PRODUCTS) == expected
+
+class SameNameSite(mock_site.MockSite):
+    """Локальный сайт, где у всех товаров одно название и разные артикулы"""
+
+    def product_page(self, index):
+        return super().product_page(index).replace(f"Тестовый товар {index}", "Тестовый товар")
+
+def test_resume_keeps_names_of_written_products(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_client, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(http_client, 'REQUESTS_PER_SECOND', 0)
+    monkeypatch.setattr(crawl_control, 'RESPECT_ROBOTS', False)
+    site = SameNameSite(products=1)
+    server, base = mock_site.start(site)
+    profile = site_profile.SiteProfile('mock', base, ['/catalog/kotly/'], None,
+                                       str(tmp_path / 'products.csv'), str(tmp_path / 'photos'))
+    close = parser2.CsvCheckpointWriter.close
+
+    def crawl(resume):
+        with ThreadPoolExecutor(2) as page_executor, ThreadPoolExecutor(2) as image_executor:
+            parser_full.crawl(profile, page_executor, image_executor, resume)
+
+    try:
+        # Первый запуск прерван после первого товара: журнал остаётся
+        monkeypatch.setattr(parser2.CsvCheckpointWriter, 'close', lambda self, completed=True: close(self, False))
+        crawl(resume=False)
+        monkeypatch.setattr(parser2.CsvCheckpointWriter, 'close', close)
+        # Новый процесс: занятые имена не помнит
+        parser_photo_final._allocated_names.clear()
+        site.products = 2
+        crawl(resume=True)
+    finally:
+        server.shutdown()
+
+    with open(profile.csv_file, newline='', encoding='utf-8-sig') as f:
+        images = [row['Изображения'] for row in csv.DictReader(f)]
+    assert images == ['testovyy_tovar.jpg', 'testovyy_tovar_mock-000001.jpg']
+    assert all(os.path.exists(os.path.join(profile.output_folder, image)) for image in images)
@@ -0,0 +1,55 @@
+"""sanitize_description против прежней цепочки parser2 на образцах описаний
+
+Образцы - содержимое блока li#desc в tests/descriptions. Эталон -
+parser2.extract_description и parser2.extract_first_paragraph, которые
+остаются в parser2 именно для этого сравнения.
+"""
+import glob
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+import html_sanitizer
+import parser2
+
+DESCRIPTIONS_DIR = os.path.join(os.path.dirname(__file__), "descriptions")
+SAMPLES = sorted(glob.glob(os.path.join(DESCRIPTIONS_DIR, "*.html")))
+# Образцы, из которых фраза о Вистерме должна исчезнуть целиком. В
+# 02_visterma_in_unwrapped_tags она остаётся, как и в прежней цепочке: div и
+# span снимаются раньше, и фраза становится текстом без своего элемента
+VISTERMA_REMOVED = ['03_visterma_top_level.html', '04_visterma_after_br.html',
+                    '05_visterma_quoted_after_br.html', '12_visterma_split_by_tag.html',
+                    '14_visterma_nested_list.html']
+
+def desc_block(fragment):
+    """Блок li#desc, разобранный так же, как страница товара"""
+    page = f'<html><body><h1>Товар</h1><ul><li id="desc">{fragment}</li><li id="char"></li></ul></body></html>'
+    return BeautifulSoup(page, 'lxml').find('li', id='desc')
+
+def read_sample(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def reference(fragment):
+    description = parser2.extract_description(desc_block(fragment))
+    return description, parser2.extract_first_paragraph(description)
+
+def test_corpus_is_present():
+    assert len(SAMPLES) >= 10
+
+@pytest.mark.parametrize('path', SAMPLES, ids=os.path.basename)
+def test_matches_reference(path):
+    fragment = read_sample(path)
+    assert html_sanitizer.sanitize_description(desc_block(fragment)) == reference(fragment)
+
+@pytest.mark.parametrize('name', VISTERMA_REMOVED)
+def test_visterma_text_is_removed(name):
+    fragment = read_sample(os.path.join(DESCRIPTIONS_DIR, name))
+    description, short_description = html_sanitizer.sanitize_description(desc_block(fragment))
+    for text in ('Вистерма', 'ВИСТЕРМА', 'Вист'):
+        assert text not in description
+        assert text not in short_description
+
+def test_missing_block():
+    assert html_sanitizer.sanitize_description(None) == ('', '')
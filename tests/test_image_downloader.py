@@ -0,0 +1,70 @@
+"""image_downloader: дедупликация и пропуск уже скачанных изображений"""
+import hashlib
+import os
+
+import pytest
+
+import http_client
+import image_downloader
+
+class StreamedResponse:
+    """Потоковый ответ с заданными заголовками; тело читать нельзя, если read_allowed=False"""
+
+    status_code = 200
+
+    def __init__(self, body, read_allowed=True):
+        self.body = body
+        self.read_allowed = read_allowed
+        self.headers = {'Content-Type': 'image/jpeg', 'Content-Length': str(len(body))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def iter_content(self, chunk_size):
+        assert self.read_allowed, "тело ответа читать не нужно"
+        yield self.body
+
+def add_file(store, tmp_path, name, body):
+    temp_path = tmp_path / f"{name}.part"
+    temp_path.write_bytes(body)
+    return store.add(str(temp_path), name, hashlib.sha256(body).hexdigest(), len(body))
+
+def test_duplicate_is_hard_linked(tmp_path):
+    store = image_downloader.ImageStore(str(tmp_path))
+    assert add_file(store, tmp_path, 'a.jpg', b'image') == 'a.jpg'
+    assert add_file(store, tmp_path, 'b.jpg', b'image') == 'b.jpg'
+    assert os.path.samefile(tmp_path / 'a.jpg', tmp_path / 'b.jpg')
+
+def test_duplicate_without_hard_links_gets_own_copy(tmp_path, monkeypatch):
+    def no_links(source, target):
+        raise OSError("жёсткие ссылки не поддерживаются")
+    monkeypatch.setattr(os, 'link', no_links)
+    store = image_downloader.ImageStore(str(tmp_path))
+    add_file(store, tmp_path, 'a.jpg', b'image')
+    assert add_file(store, tmp_path, 'b.jpg', b'image') == 'b.jpg'
+    assert (tmp_path / 'b.jpg').read_bytes() == b'image'
+    assert not os.path.samefile(tmp_path / 'a.jpg', tmp_path / 'b.jpg')
+
+@pytest.fixture
+def fetched(monkeypatch):
+    """Подменяет загрузку: download_image получает ответы из списка"""
+    responses = []
+    monkeypatch.setattr(http_client, 'fetch', lambda url, **kwargs: responses.pop(0))
+    monkeypatch.setattr(http_client, 'store_in_cache', lambda url, response: None)
+    monkeypatch.setattr(image_downloader, '_stores', {})
+    return responses
+
+def test_file_of_same_size_is_not_downloaded_again(tmp_path, fetched):
+    (tmp_path / 'a.jpg').write_bytes(b'old image')
+    fetched.append(StreamedResponse(b'new image', read_allowed=False))
+    assert image_downloader.download_image('http://example.com/a.jpg', 'a', str(tmp_path)) == 'a.jpg'
+    assert (tmp_path / 'a.jpg').read_bytes() == b'old image'
+
+def test_file_of_other_size_is_replaced(tmp_path, fetched):
+    (tmp_path / 'a.jpg').write_bytes(b'old')
+    fetched.append(StreamedResponse(b'new image'))
+    assert image_downloader.download_image('http://example.com/a.jpg', 'a', str(tmp_path)) == 'a.jpg'
+    assert (tmp_path / 'a.jpg').read_bytes() == b'new image'
@@ -0,0 +1,26 @@
+"""image_processing: варианты изображений для сайта"""
+import os
+
+from PIL import Image
+
+import image_processing
+
+def test_variants_keep_source_extension(tmp_path):
+    Image.new('RGB', (40, 20), 'red').save(tmp_path / 'a.jpg')
+    Image.new('RGBA', (20, 40), (0, 0, 255, 128)).save(tmp_path / 'a.png')
+
+    processed, skipped, errors = image_processing.process_folder(str(tmp_path))
+
+    assert (processed, skipped, errors) == (2, 0, 0)
+    web = tmp_path / image_processing.WEB_FOLDER
+    assert sorted(os.listdir(web)) == ['a.jpg.jpg', 'a.jpg.webp', 'a.png.png', 'a.png.webp']
+    assert sorted(os.listdir(tmp_path / image_processing.THUMBS_FOLDER)) == ['a.jpg.jpg', 'a.png.jpg']
+    with Image.open(web / 'a.jpg.jpg') as image:
+        assert image.size == (40, 20)
+    with Image.open(web / 'a.png.png') as image:
+        assert image.size == (20, 40)
+
+def test_unchanged_images_are_skipped(tmp_path):
+    Image.new('RGB', (10, 10), 'red').save(tmp_path / 'a.jpg')
+    image_processing.process_folder(str(tmp_path))
+    assert image_processing.process_folder(str(tmp_path)) == (0, 1, 0)